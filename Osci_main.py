@@ -1,9 +1,9 @@
+import os
 import threading
 import time
+import queue
+from collections import OrderedDict
 import numpy as np
-import keyboard
-import sounddevice as sd
-import mido
 
 
 
@@ -16,76 +16,25 @@ def midi_note_to_frequency(note):
 def analyze_midi_melody(midi_file, max_frequency=2000.0):
     """
     Analiza un archivo MIDI y devuelve una lista de tuplas (frecuencia, duración).
-    Limita la frecuencia máxima para evitar sonidos agudos desagradables.
+    Combina todas las pistas con su mapa de tempo y reutiliza la compilación en caché
+    si el archivo no ha cambiado. Limita la frecuencia máxima para evitar sonidos agudos desagradables.
     """
     MAX_NOTE_DURATION = 5.0
     MIN_NOTE_DURATION = 0.05
-    MAX_SILENCE_DURATION = 0.3
-    DEFAULT_TEMPO = 500000
 
-    melody_data = []
-    active_notes = {}
-    midi_data = mido.MidiFile(midi_file)
-    tempo = DEFAULT_TEMPO
-    ticks_per_beat = midi_data.ticks_per_beat
-    ticks_to_seconds = (tempo / 1_000_000) / ticks_per_beat
+    from compilador_midi import compila_midi, melodia
 
-    current_time = 0
-    last_event_time = 0
-    current_frequency = 0
-
-    main_track = max(midi_data.tracks, key=lambda track: sum(1 for msg in track if msg.type == 'note_on'))
-
-    for msg in main_track:
-        if msg.type == 'set_tempo':
-            tempo = msg.tempo
-            ticks_to_seconds = (tempo / 1_000_000) / ticks_per_beat
-
-        current_time += msg.time * ticks_to_seconds
-
-        if msg.type == 'note_on' and msg.velocity > 0:
-            note = msg.note
-            frequency = midi_note_to_frequency(note)
-
-            # Limitar la frecuencia máxima
-            if frequency > max_frequency:
-                frequency = max_frequency
-
-            if frequency != current_frequency or current_time - last_event_time > MIN_NOTE_DURATION:
-                if current_frequency != 0:
-                    duration = current_time - last_event_time
-                    melody_data.append((current_frequency, max(MIN_NOTE_DURATION, min(duration, MAX_NOTE_DURATION))))
-
-                current_frequency = frequency
-                last_event_time = current_time
-
-        elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-            if current_frequency != 0:
-                duration = current_time - last_event_time
-                melody_data.append((current_frequency, max(MIN_NOTE_DURATION, min(duration, MAX_NOTE_DURATION))))
-                current_frequency = 0
-                last_event_time = current_time
-
-    if current_frequency != 0:
-        duration = current_time - last_event_time
-        melody_data.append((current_frequency, max(MIN_NOTE_DURATION, min(duration, MAX_NOTE_DURATION))))
-
-    cleaned_melody = []
-    for frequency, duration in melody_data:
-        if frequency == 0 and duration > MAX_SILENCE_DURATION:
-            continue
-        cleaned_melody.append((frequency, duration))
-
-    return cleaned_melody
+    cancion = compila_midi(midi_file)
+    return melodia(cancion, max_frequency, MIN_NOTE_DURATION, MAX_NOTE_DURATION)
 
 
 
 """
------------- DECLARACIÓN DE PARÁMETROS Y VARIABLES -----------------
+------------ DECLARACIÓN DE PARÁMETROS POR DEFECTO -----------------
 """
 
 # Diccionario de archivos
-files_npz = {
+DEFAULT_FILES_NPZ = {
     'peli': 'peli_redimensionado.npz',
     'text': 'text_redimensionado.npz',
     'break1': 'break1_redimensionado.npz',
@@ -97,13 +46,13 @@ files_npz = {
 AUDIO_MODE = "COMPLEX" # ORDENADOR O COMPLEX
 
 # Paramétros de reproducción de audio.
-midi_parameters = {
+DEFAULT_MIDI_PARAMETERS = {
     "frequency": 50.0,  # Frecuencia MIDI inicial (A4)
     "selected_animation": 1,  # Animación seleccionada inicialmente
     "phasor" : 0,
     "n_bits_phasor": 12,
     "TABLE_SIZE": 2 ** 12,
-    "audio_buffer_len": 512, 
+    "audio_buffer_len": 512,
     "FREQ_SAMPLE": 44100,
     "AUDIO_DEVICE": 34,
     "song_mode": False,
@@ -114,61 +63,39 @@ midi_parameters = {
 }
 
 # Parámetros de reproducción por defecto del vídeo
-video_parameters = {
+DEFAULT_VIDEO_PARAMETERS = {
     "fps": 25,              # Número de frames por segundo (velocidad de reproducción)
     "selected_animation": 2, # Animación que va a reproducirse (0: primera animación)
-    "effect": "none"        # Efecto aplicado a los datos (por ejemplo, "none", "echo", "distortion")
+    "effect": "none",       # Efecto aplicado a los datos (por ejemplo, "none", "echo", "distortion")
+    "morph": True,          # Interpolación entre frames consecutivos dentro del intervalo de cada frame
+    "memory_budget_mb": 256 # Memoria máxima para las animaciones cargadas en caché
 }
 
-# Archivo MIDI 
-midi_file = "Techno-3.MID"  # Nombre del archivo MIDI predefinido
-
-# Analizar la canción y almacenar las notas
-try:
-    midi_parameters["song_notes"] = analyze_midi_melody(midi_file)
-    print(f"[INFO] Canción '{midi_file}' analizada y lista para reproducción.")
-except Exception as e:
-    print(f"[ERROR] No se pudo analizar la canción '{midi_file}': {e}")
-    midi_parameters["song_notes"] = []
+# FPS de reproducción a los que una animación con FPS guardados suena a su velocidad original;
+# el knob 4 (y la banda "fps" de la modulación por audio) la acelera o ralentiza en proporción
+REFERENCE_FPS = 25
 
+# Tipo de las muestras en todo el camino de tiempo real (almacenamiento, efectos, tabla y stream)
+DEFAULT_DTYPE = np.float32
 
-# Inicialización de variables de audio
-phasor = 0
-frame_idx = 0
-rotation = 0
-distortion = 0
-increment = 0
-scale = 1.0
-paused_frame_idx = 0  # Índice del frame pausado
-last_note_change_time = 0  # Tiempo de la última actualización de nota en el modo canción
-
-# Variables para almacenar el último valor de rotación y la matriz de rotación cacheada
-last_rotation = None
-rotation_matrix = None
-
-current_wave = np.zeros((midi_parameters["TABLE_SIZE"], 2), dtype=np.float64)  # Tabla para la animación actual
-sd.default.samplerate = midi_parameters["FREQ_SAMPLE"]
-sd.default.device = midi_parameters["AUDIO_DEVICE"]
-
-# Variable para controlar la finalización del programa
-exit_flag = False
+# Número de canales de salida según el modo de audio
+NUM_CHANNELS = {
+    "ORDENADOR": 2,  # Estéreo para altavoces del ordenador
+    "COMPLEX": 8     # Salida multicanal para osciloscopio y altavoces externos
+}
 
-# Diccionario para almacenar la caché de animaciones
-animation_cache = {}
+# Sliders 3 a 8: control MIDI -> índice de la animación en files_npz
+SLIDER_ANIMATIONS = {93: 0, 77: 1, 76: 2, 71: 3, 74: 4, 7: 5}
 
-# Evento para notificar que la caché está creada
-data_processed_event = threading.Event()
+# Archivo MIDI
+MIDI_FILE = "Techno-3.MID"  # Nombre del archivo MIDI predefinido
 
-# Evento para notificar que ha comenzado la reproducción
-data_playback_event = threading.Event()
+# Puerto MIDI del controlador
+MIDI_PORT = 'WORLDE    0'
 
-# Configuración de dispositivos y canales según el modo
-if AUDIO_MODE == "ORDENADOR":
-    midi_parameters["NUM_CHANNELS"] = 2  # Estéreo para altavoces del ordenador
-elif AUDIO_MODE == "COMPLEX":
-    midi_parameters["NUM_CHANNELS"] = 8   # Salida multicanal para osciloscopio y altavoces externos
-else:
-    raise ValueError("Dispositivo de audio no válido.")
+# Recarga en caliente de animaciones y canción
+ANIMATION_DIR = "."           # Directorio vigilado (.npz y .svg)
+RELOAD_POLL_INTERVAL = 1.0    # Segundos entre comprobaciones de cambios
 
 
 
@@ -178,521 +105,1083 @@ else:
 """
 
 
-def play_song():
+def normalize(frame):
     """
-    Reproduce la melodía cargada, actualizando la frecuencia según las notas.
+    Normaliza un frame
     """
-    global increment, last_note_change_time
-
-    current_time = time.time()
-    MAX_DURATION = 2.0  # Duración máxima para cualquier nota, en segundos
-
-    if midi_parameters["song_mode"] and midi_parameters["song_notes"]:
-        # Verificar si es momento de cambiar a la siguiente nota
-        if current_time - last_note_change_time >= min(midi_parameters["note_duration"], MAX_DURATION):
-            current_idx = midi_parameters["current_note_idx"]
-            note, duration = midi_parameters["song_notes"][current_idx]
-
-            # Actualizar la frecuencia según la nota MIDI
-            frequency = note
-            midi_parameters["frequency"] = frequency
-
-            # Calcular el incremento basado en la frecuencia actual
-            increment = compute_incremento(midi_parameters["frequency"])
-
-            # Limitar la duración de la nota a un máximo de MAX_DURATION
-            midi_parameters["note_duration"] = min(duration, MAX_DURATION)
-            last_note_change_time = current_time
-
-            print(f"[INFO] Nota actual: {note} - Frecuencia: {frequency:.2f} Hz")
-
-            # Avanzar al siguiente índice de nota
-            midi_parameters["current_note_idx"] += 1
-
-            # Reiniciar el índice si se llega al final de la canción
-            if midi_parameters["current_note_idx"] >= len(midi_parameters["song_notes"]):
-                midi_parameters["current_note_idx"] = 0
 
+    max_val = np.max(np.abs(frame))  # Encuentra el valor máximo absoluto en los datos
+    if max_val > 0:  # Evita división por cero
+        frame_normalized = ((frame / max_val)-0.5)*2  # Normaliza los datos a un rango de [-1, 1]
+    else:
+        frame_normalized = frame
 
+    return frame_normalized
 
-def midi_note_to_frequency(note):
+def load_animation(file, dtype=np.float32):
     """
-    Convierte una nota MIDI a su frecuencia correspondiente.
+    Carga un archivo .npz, aplica una rotación inicial de 90 grados y convierte los datos al tipo indicado.
+    Devuelve un único array (n_frames, n_puntos, 2) con los frames en orden.
     """
-    return 440.0 * (2.0 ** ((note - 69) / 12.0))
+    # Matriz de rotación para 90 grados en el sentido de las agujas del reloj
+    radians_90 = np.deg2rad(90)
+    rotation_matrix_90 = np.array([[np.cos(radians_90), -np.sin(radians_90)],
+                                    [np.sin(radians_90), np.cos(radians_90)]], dtype=dtype)
 
-def handle_control_change(control, value):
-    """
-    Maneja los controles MIDI (knobs y sliders). Los cambios serán permanentes.
-    """
-    print(control, value)
-    global increment
-    
-    if control == 72:
-        # Knob 1: Ajuste de escala
-        adjust_scale(value)
-    elif control == 16:
-        # Knob 2: Ajuste de rotación
-        adjust_rotation(value)
-    elif control == 79:
-        # Knob 3: Ajuste de distorsión
-        adjust_distortion(value)
-    elif control == 19:
-        # Knob 4: Ajuste de FPS
-        adjust_fps(value)
-    elif control == 91:
-        # Knob 5: Efecto adicional (reserva para futuro)
-        pass
-    elif control == 18:
-        # Knob 6: Efecto adicional (reserva para futuro)
-        pass
-    elif control == 17:
-        # Knob 7: Efecto adicional (reserva para futuro)
-        pass
-    elif control == 114:
-        # Knob 8: Efecto adicional (reserva para futuro)
-        pass
+    with np.load(file) as data:
+        frames = np.stack([data[key] for key in data.files if key.startswith("frame_")]).astype(dtype)
 
-    # Slider 1 (control 75): Modo pausa
-    elif control == 75:
-        if value >= 64 and not midi_parameters["pause_mode"]:
-            midi_parameters["pause_mode"] = True
-            global paused_frame_idx
-            paused_frame_idx = frame_idx  # Almacenar el índice del frame actual
-            print(f"[INFO] Modo de pausa activado en el índice de frame: {paused_frame_idx}")
-        elif value < 64 and midi_parameters["pause_mode"]:
-            midi_parameters["pause_mode"] = False
-            print("[INFO] Modo de pausa desactivado.")
-
-    # Slider 2 (control 73): Modo canción
-    elif control == 73:
-        if value >= 64:
-            midi_parameters["song_mode"] = True
-            midi_parameters["current_note_idx"] = 0
-            print("[INFO] Modo canción activado.")
-        else:
-            midi_parameters["song_mode"] = False
-            print("[INFO] Modo canción desactivado. Volviendo al modo normal.")
-
-    # Sliders 3 a 8 para seleccionar animaciones
-    elif control == 93:  # Slider 3
-        if value >= 64:
-            video_parameters["selected_animation"] = 0
-            print("[INFO] Animación 1 seleccionada (baile1).")
-    elif control == 77:  # Slider 4
-        if value >= 64:
-            video_parameters["selected_animation"] = 1
-            print("[INFO] Animación 2 seleccionada (baile2).")
-    elif control == 76:  # Slider 5
-        if value >= 64:
-            video_parameters["selected_animation"] = 2
-            print("[INFO] Animación 3 seleccionada (break1).")
-    elif control == 71:  # Slider 6
-        if value >= 64:
-            video_parameters["selected_animation"] = 3
-            print("[INFO] Animación 4 seleccionada (break2).")
-    elif control == 74:  # Slider 7
-        if value >= 64:
-            video_parameters["selected_animation"] = 4
-            print("[INFO] Animación 5 seleccionada (stand).")
-    elif control == 7:  # Slider 8
-        if value >= 64:
-            video_parameters["selected_animation"] = 5
-            print("[INFO] Animación 6 seleccionada (Triangulo).")
-    else:
-        # Rango de frecuencias
-        FREQ_MIN = 0.2  # Hz
-        FREQ_MAX = 2000  # Hz
-        frequency = FREQ_MIN * (FREQ_MAX / FREQ_MIN) ** (value / 127)
-        midi_parameters['frequency'] = frequency
-        increment = compute_incremento(midi_parameters["frequency"])
-        print(f"Frecuencia ajustada a: {frequency} Hz")
+    # Aplicar la rotación inicial a todos los frames
+    return np.dot(frames, rotation_matrix_90)
 
 
-def adjust_fps(value):
+def load_frame_rate(file):
     """
-    Ajusta los FPS de la animación utilizando el Knob 4.
-    El rango de FPS es de 10 a 70.
+    Devuelve los frames por segundo con los que se guardó la animación,
+    o None si el archivo no lo indica (preprocesados antiguos).
     """
-    # Mapea el valor del controlador (0-127) al rango de FPS (10-70)
-    min_fps = 10
-    max_fps = 120
-    fps = min_fps + (max_fps - min_fps) * (value / 127.0)
-    video_parameters["fps"] = int(fps)
-    print(f"[INFO] FPS ajustado a: {video_parameters['fps']}")
-
-def adjust_scale(value):
+    with np.load(file) as data:
+        return float(data["fps"]) if "fps" in data.files else None
+
+
+def animation_name(path):
     """
-    Ajusta el escalado de la señal (visual y de audio).
+    Nombre de la animación asociada a un archivo .npz (sin el sufijo _redimensionado).
     """
-    global scale
-    # Escalar entre un mínimo (0.1) y un máximo (2.0)
-    scale = 0.1 + (1.9 * value) / 127
-    print(f"[INFO] Escalado ajustado a: {scale:.2f}")
-
+    name = os.path.splitext(os.path.basename(path))[0]
+    if name.endswith("_redimensionado"):
+        name = name[:-len("_redimensionado")]
+    return name
 
 
-def adjust_rotation(value):
+class AnimationManager:
     """
-    Ajusta la rotación de la animación.
+    Caché de animaciones con carga bajo demanda, precarga en segundo plano y
+    expulsión LRU cuando se supera el presupuesto de memoria.
     """
-    global rotation
-    # Rotar de 0 a 360 grados según el valor del controlador
-    rotation = (value / 127.0) * 360.0
-    print(f"[INFO] Rotación ajustada a: {rotation:.2f} grados")
 
+    def __init__(self, files, memory_budget_mb, dtype=np.float32):
+        self.files = files
+        self.dtype = dtype
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.cache = OrderedDict()  # Nombre -> frames, de menos a más recientemente usada
+        self.load_times = {}        # Nombre -> latencia de la última carga en segundos
+        self.frame_rates = {}       # Nombre -> frames por segundo guardados (None si no se conocen)
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+        self.requested = set()
+        self.failed = set()         # Animaciones cuya carga falló (no se reintentan)
+        self.current = None         # Animación en reproducción (nunca se expulsa de la caché)
+        self.worker = None
+
+    def start(self):
+        """
+        Arranca el hilo de precarga en segundo plano.
+        """
+        self.worker = threading.Thread(target=self._prefetch_worker, daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        """
+        Detiene el hilo de precarga.
+        """
+        self.pending.put(None)
+
+    def select(self, name):
+        """
+        Marca la animación en reproducción para protegerla de la expulsión.
+        """
+        with self.lock:
+            self.current = name
+
+    def load(self, name, force=False, file=None, prefetch=False):
+        """
+        Carga una animación de forma síncrona (o la devuelve de la caché).
+        Con force=True vuelve a leer el archivo y sustituye la versión en caché
+        de forma atómica, sin dejar un hueco en la reproducción.
+        Con file se lee esa ruta en lugar de la registrada (p. ej. una animación nueva).
+        Con prefetch=True la animación se descarta (y se devuelve None) si no cabe en el
+        presupuesto junto a la animación en reproducción.
+        """
+        with self.lock:
+            if name in self.cache and not force:
+                self.cache.move_to_end(name)
+                return self.cache[name]
+
+        if file is None:
+            file = self.files[name]
+
+        start_time = time.perf_counter()
+        frames = load_animation(file, self.dtype)
+        frame_rate = load_frame_rate(file)
+        elapsed_time = time.perf_counter() - start_time
+
+        with self.lock:
+            current = self.cache.get(self.current) if self.current != name else None
+            if prefetch and current is not None and current.nbytes + frames.nbytes > self.memory_budget:
+                self.requested.discard(name)
+                print(f"[INFO] Precarga de '{name}' omitida: no cabe en memoria junto a '{self.current}'.")
+                return None
+
+            self.cache[name] = frames
+            self.frame_rates[name] = frame_rate
+            self.cache.move_to_end(name)
+            self.requested.discard(name)
+            self.failed.discard(name)
+            self.load_times[name] = elapsed_time
+            self._evict(keep=name)
+
+        print(f"[INFO] Animación '{name}' cargada en {elapsed_time * 1000:.1f} ms ({frames.nbytes / 1e6:.1f} MB).")
+        return frames
+
+    def get(self, name):
+        """
+        Devuelve una animación de la caché sin bloquear. Si no está cargada,
+        solicita su carga en segundo plano y devuelve None.
+        """
+        with self.lock:
+            if name in self.cache:
+                self.cache.move_to_end(name)
+                return self.cache[name]
+        self.request(name)
+        return None
+
+    def request(self, name):
+        """
+        Encola la carga en segundo plano de una animación si no está ya en caché o pendiente.
+        """
+        with self.lock:
+            if name in self.cache or name in self.requested or name in self.failed:
+                return
+            self.requested.add(name)
+        self.pending.put(name)
+
+    def mark_failed(self, name):
+        """
+        Registra que la carga de una animación falló para no reintentarla en segundo plano.
+        """
+        with self.lock:
+            self.requested.discard(name)
+            self.failed.add(name)
+
+    def has_failed(self, name):
+        """
+        Indica si la última carga en segundo plano de una animación falló.
+        """
+        with self.lock:
+            return name in self.failed
+
+    def prefetch(self, names):
+        """
+        Encola la precarga de varias animaciones.
+        """
+        for name in names:
+            self.request(name)
+
+    def frame_rate(self, name):
+        """
+        Frames por segundo con los que se guardó una animación cargada (None si no se conocen).
+        """
+        with self.lock:
+            return self.frame_rates.get(name)
+
+    def memory_usage(self):
+        """
+        Memoria ocupada por las animaciones en caché, en bytes.
+        """
+        with self.lock:
+            return sum(frames.nbytes for frames in self.cache.values())
+
+    def _evict(self, keep):
+        """
+        Expulsa las animaciones usadas hace más tiempo hasta cumplir el presupuesto de memoria,
+        sin expulsar nunca keep ni la animación en reproducción.
+        Debe llamarse con el cerrojo adquirido.
+        """
+        total = sum(frames.nbytes for frames in self.cache.values())
+        for name in list(self.cache.keys()):
+            if total <= self.memory_budget:
+                break
+            if name == keep or name == self.current:
+                continue
+            total -= self.cache.pop(name).nbytes
+            print(f"[INFO] Animación '{name}' expulsada de la caché.")
+
+    def _prefetch_worker(self):
+        """
+        Hilo que atiende las solicitudes de carga en segundo plano.
+        """
+        while True:
+            name = self.pending.get()
+            if name is None:
+                break
+            try:
+                self.load(name, prefetch=True)
+            except Exception as e:
+                self.mark_failed(name)
+                print(f"[ERROR] No se pudo cargar la animación '{name}': {e}")
 
 
-def adjust_distortion(value):
+"""
+---------------------------- BACKENDS ----------------------------
+"""
+
+class HardwareBackend:
     """
-    Ajusta la distorsión de la señal.
+    Backend real: sounddevice para el audio, mido para el MIDI y keyboard para el teclado.
+    Las librerías se importan solo cuando se usan.
     """
-    global distortion
-    # Distorsión ajustada entre 0 (sin distorsión) y 0.8 (máxima distorsión controlada)
-    distortion = (value / 127.0) * 0.8
-    print(f"[INFO] Distorsión ajustada a: {distortion:.2f}")
 
+    def output_stream(self, **kwargs):
+        import sounddevice as sd
+        return sd.OutputStream(**kwargs)
 
-def apply_effects(frame, scale_factor=1.0, rotation_degrees=0, distortion_level=0):
-    """
-    Aplica escalado, rotación, inversión del eje Y, distorsión y normalización a un frame con optimizaciones.
-    """
-    global last_rotation, rotation_matrix
+    def input_stream(self, **kwargs):
+        import sounddevice as sd
+        return sd.InputStream(**kwargs)
 
-    # 1. Aplicar escalado con un valor mínimo
-    frame_scaled = frame * scale_factor
+    def open_midi_input(self, port_name):
+        import mido
+        return mido.open_input(port_name)
 
-    # 2. Invertir el eje Y para corregir la orientación
-    frame_scaled[:, 1] *= -1
+    def add_hotkey(self, key, action):
+        import keyboard
+        keyboard.add_hotkey(key, action)
 
-    # 3. Calcular la matriz de rotación solo si el ángulo ha cambiado
-    if rotation_degrees != last_rotation:
-        radians = np.deg2rad(rotation_degrees)
-        cos_theta = np.cos(radians)
-        sin_theta = np.sin(radians)
-        rotation_matrix = np.array([[cos_theta, -sin_theta], [sin_theta, cos_theta]])
-        last_rotation = rotation_degrees
+    def stop(self):
+        import sounddevice as sd
+        # Detener el stream sin comprobar si está activo
+        sd.stop()
 
-    # 4. Aplicar rotación usando la matriz cacheada
-    frame_rotated = np.dot(frame_scaled, rotation_matrix)
 
-    # 5. Aplicar distorsión suavizada
-    if distortion_level > 0:
-        gain = 5 * distortion_level
-        frame_distorted = np.tanh(gain * frame_rotated)
-    else:
-        frame_distorted = frame_rotated
+class DummyStream:
+    """
+    Stream de salida sin dispositivo. Los bloques se generan bajo demanda con pull().
+    """
 
-    # 6. Normalizar la señal para evitar cambios en el volumen
-    max_val = np.max(np.abs(frame_distorted))
-    if max_val > 0:
-        frame_normalized = frame_distorted / max_val
-    else:
-        frame_normalized = frame_distorted
+    def __init__(self, callback, channels, blocksize, dtype="float32", **kwargs):
+        self.callback = callback
+        self.channels = channels
+        self.blocksize = blocksize
+        self.dtype = dtype
 
-    return frame_normalized
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *args):
+        return False
 
+    def pull(self):
+        """
+        Ejecuta el callback una vez y devuelve el bloque generado.
+        """
+        outdata = np.zeros((self.blocksize, self.channels), dtype=self.dtype)
+        self.callback(outdata, self.blocksize, None, None)
+        return outdata
 
 
-def normalize(frame):
+class DummyInputStream:
     """
-    Normaliza un frame
+    Stream de entrada sin dispositivo. Los bloques se inyectan con push().
     """
 
-    max_val = np.max(np.abs(frame))  # Encuentra el valor máximo absoluto en los datos
-    if max_val > 0:  # Evita división por cero
-        frame_normalized = ((frame / max_val)-0.5)*2  # Normaliza los datos a un rango de [-1, 1]
-    else:
-        frame_normalized = frame
-
-    return frame_normalized
+    def __init__(self, callback, channels, blocksize, **kwargs):
+        self.callback = callback
+        self.channels = channels
+        self.blocksize = blocksize
 
-def load_animation(file):
-    """
-    Carga un archivo .npz, aplica una rotación inicial de 90 grados y convierte los datos en float64.
-    """
-    # Matriz de rotación para 90 grados en el sentido de las agujas del reloj
-    radians_90 = np.deg2rad(90)
-    rotation_matrix_90 = np.array([[np.cos(radians_90), -np.sin(radians_90)],
-                                    [np.sin(radians_90), np.cos(radians_90)]])
+    def start(self):
+        pass
 
-    data = np.load(file)
-    animation = {}
+    def stop(self):
+        pass
 
-    for key in data.files:
-        frame = np.array(data[key], dtype=np.float64)
-        # Aplicar la rotación inicial a cada frame
-        animation[key] = np.dot(frame, rotation_matrix_90)
+    def close(self):
+        pass
 
-    return animation
+    def push(self, indata):
+        """
+        Entrega un bloque (muestras, canales) al callback como haría el dispositivo.
+        """
+        self.callback(indata, len(indata), None, None)
 
 
-def get_audio_buffer_from_wave(bits_idx, incr, tabla_datos_xy):
+class DummyMidiInput:
     """
-    LLena el buffer de audio desde la tabla de ondas.
-    Si el programa está terminando, llena el buffer con ceros.
+    Puerto MIDI sin dispositivo. Los mensajes se inyectan con send().
     """
-    global phasor
-    lr_channel = np.zeros((midi_parameters["audio_buffer_len"], 2))
-    
-    if tabla_datos_xy is not None and len(tabla_datos_xy) > 0:
-        max_val = np.max(np.abs(tabla_datos_xy))
-        if max_val > 0:
-            tabla_datos_xy = tabla_datos_xy / max_val
-
-        bit_shift = 32 - bits_idx  # Calcular fuera del ciclo
-        for i in range(midi_parameters["audio_buffer_len"]):
-            idx = phasor >> bit_shift
-            
-            # Asegúrate de que el índice no exceda los límites de tabla_datos_xy
-            if idx >= len(tabla_datos_xy):
-                idx = idx % len(tabla_datos_xy)  # Envolver el índice si es mayor
-
-            lr_channel[i, :] = tabla_datos_xy[idx, :]
-            phasor += incr
-            phasor = (phasor & 0xFFFFFFFF)
-    else:
-        # Si no hay datos en la tabla, devuelve silencio (buffer lleno de ceros)
-        lr_channel = np.zeros((midi_parameters["audio_buffer_len"], 2))
-    
-    return lr_channel
 
-def callback(outdata, frames, time, status):
-    """
-    Callback para el stream de audio.
-    """
-    if status:
-        print(status)
+    def __init__(self):
+        self.messages = queue.Queue()
 
-    if exit_flag:
-        outdata.fill(0)
-    else:
-        # Actualizar el incremento según la frecuencia actual
-        global increment
-        increment = compute_incremento(midi_parameters["frequency"])
+    def send(self, msg):
+        self.messages.put(msg)
 
-        # Obtener el buffer de audio normalizado
-        audio_buffer = normalize(get_audio_buffer_from_wave(midi_parameters["n_bits_phasor"], increment, current_wave))
+    def iter_pending(self):
+        while not self.messages.empty():
+            yield self.messages.get()
 
-        if midi_parameters["NUM_CHANNELS"] == 2:
-            # Modo PC_SPEAKERS: Salida estéreo
-            outdata[:, 0] = audio_buffer[:, 0]  # Canal izquierdo
-            outdata[:, 1] = audio_buffer[:, 1]  # Canal derecho
+    def close(self):
+        pass
 
-        elif midi_parameters["NUM_CHANNELS"] == 8:
-            # Modo AUDIO_INTERFACE: Salida multicanal
-            multi_channel_output = np.zeros((frames, 8))
-            multi_channel_output[:, 0:2] = audio_buffer  # Canales 1 y 2 (osciloscopio)
-            multi_channel_output[:, 2:4] = audio_buffer  # Canales 3 y 4 (altavoces)
-            outdata[:] = multi_channel_output
 
-        else:
-            raise ValueError("Número de canales no válido.")
+class DummyBackend:
+    """
+    Backend sin hardware para pruebas: no abre dispositivos ni importa sus librerías.
+    """
 
+    def __init__(self):
+        self.stream = None
+        self.input = None
+        self.midi_input = DummyMidiInput()
+        self.hotkeys = {}
 
+    def output_stream(self, **kwargs):
+        self.stream = DummyStream(**kwargs)
+        return self.stream
 
+    def input_stream(self, **kwargs):
+        self.input = DummyInputStream(**kwargs)
+        return self.input
 
+    def open_midi_input(self, port_name):
+        return self.midi_input
 
-def stop_program():
-    """
-    Detiene todos los hilos y el programa principal
-    """
-    global exit_flag
-    exit_flag = True
-    print("[INFO] El programa se está cerrando...")
-    try:
-        # Detener el stream sin comprobar si está activo
-        sd.stop()
-    except Exception as e:
-        print(f"[ERROR] No se pudo detener el stream de audio: {e}")
+    def add_hotkey(self, key, action):
+        self.hotkeys[key] = action
 
+    def stop(self):
+        pass
 
-def compute_incremento(freq):
-    """
-    Calcula el incremento del fasor basado en la frecuencia deseada.
-    """
-    incremento = int(pow(2, 32) * float(freq) / midi_parameters["FREQ_SAMPLE"])
-    return incremento
 
 
 
 """
----------------------------- ESTRUCTURA DE HILOS -----------------------------
+---------------------------- MOTOR ----------------------------
 """
 
-def analysis_thread(files_npz):
+class OsciEngine:
     """
-    Hilo que carga las animaciones y crea la caché.
+    Motor de reproducción: contiene el estado compartido por los hilos de análisis,
+    reproducción, MIDI, teclado y recarga. Construirlo no abre dispositivos ni analiza archivos.
     """
-    global animation_cache
 
-    while not exit_flag:
+    def __init__(self, backend=None, files_npz=None, midi_file=MIDI_FILE, audio_mode=AUDIO_MODE,
+                 midi_parameters=None, video_parameters=None, dtype=DEFAULT_DTYPE):
+        self.backend = backend if backend is not None else HardwareBackend()
+        self.dtype = np.dtype(dtype)
+        self.files_npz = dict(files_npz if files_npz is not None else DEFAULT_FILES_NPZ)
+        self.midi_file = midi_file
+
+        # Paramétros de reproducción (copias propias para que varios motores puedan coexistir)
+        self.midi_parameters = dict(DEFAULT_MIDI_PARAMETERS, song_notes=[])
+        self.midi_parameters.update(midi_parameters or {})
+        self.video_parameters = dict(DEFAULT_VIDEO_PARAMETERS)
+        self.video_parameters.update(video_parameters or {})
+
+        # Configuración de canales según el modo
+        if audio_mode not in NUM_CHANNELS:
+            raise ValueError("Dispositivo de audio no válido.")
+        self.midi_parameters["NUM_CHANNELS"] = NUM_CHANNELS[audio_mode]
+
+        # Inicialización de variables de audio
+        self.phasor = 0
+        self.frame_idx = 0
+        self.rotation = 0
+        self.distortion = 0
+        self.increment = 0
+        self.scale = 1.0
+        self.paused_frame_idx = 0  # Índice del frame pausado
+        self.last_note_change_time = 0  # Tiempo de la última actualización de nota en el modo canción
+        self.song_loaded = False  # La canción se analiza la primera vez que se activa el modo canción
+
+        # Modulación por audio (knobs 5 a 8); los parámetros se comparten con el modulador
+        self.audio_reactive = None
+        self.audio_reactive_parameters = {}
+
+        # Variables para almacenar el último valor de rotación y la matriz de rotación cacheada
+        self.last_rotation = None
+        self.rotation_matrix = None
+
+        self.current_wave = np.zeros((self.midi_parameters["TABLE_SIZE"], 2), dtype=self.dtype)  # Tabla para la animación actual
+
+        # Posición (fraccionaria) dentro de la animación, en frames guardados
+        self.frame_position = 0.0
+
+        # Morphing entre frames: tupla (tabla actual, tabla siguiente, muestra de inicio del frame,
+        # duración del frame en muestras). Se publica con una única asignación para que el
+        # callback nunca vea un estado a medias.
+        self.morph_waves = None
+        # Tablas con efectos ya calculadas: (frames, efectos, {índice: tabla}), para reutilizarlas entre ticks
+        self.wave_cache = None
+        self.sample_counter = 0  # Número de muestras generadas desde el inicio del stream
+        self.sample_ramp = np.arange(self.midi_parameters["audio_buffer_len"], dtype=np.int64)  # Rampa por muestra precalculada
+        self.blend_ramp = np.arange(self.midi_parameters["audio_buffer_len"], dtype=self.dtype)  # Rampa de mezcla precalculada
+        self.blend = np.zeros(self.midi_parameters["audio_buffer_len"], dtype=self.dtype)  # Pesos de mezcla del bloque actual
+
+        # Variable para controlar la finalización del programa
+        self.exit_flag = False
+
+        # Gestor de la caché de animaciones
+        self.animation_manager = AnimationManager(self.files_npz, self.video_parameters["memory_budget_mb"], self.dtype)
+
+        # Evento para notificar que la animación inicial está cargada
+        self.data_processed_event = threading.Event()
+
+        # Estadísticas del callback de audio para medir perturbaciones durante las recargas
+        self.callback_stats = {
+            "max_duration": 0.0,  # Duración máxima de un callback, en segundos
+            "xruns": 0            # Número de bloques con estado de error (underflow/overflow)
+        }
+
+    def load_song(self):
+        """
+        Analiza la canción MIDI y la publica para el modo canción.
+        """
         try:
-            print("[INFO] Cargando animaciones...")
-            start_time = time.time()
+            self.midi_parameters["song_notes"] = analyze_midi_melody(self.midi_file)
+            print(f"[INFO] Canción '{self.midi_file}' analizada y lista para reproducción.")
+        except Exception as e:
+            print(f"[ERROR] No se pudo analizar la canción '{self.midi_file}': {e}")
+            self.midi_parameters["song_notes"] = []
+        self.song_loaded = True
+
+    def play_song(self):
+        """
+        Reproduce la melodía cargada, actualizando la frecuencia según las notas.
+        """
+        midi_parameters = self.midi_parameters
+        current_time = time.time()
+        MAX_DURATION = 2.0  # Duración máxima para cualquier nota, en segundos
+
+        # Referencia local: la canción puede sustituirse en caliente desde otro hilo
+        song_notes = midi_parameters["song_notes"]
+
+        if midi_parameters["song_mode"] and song_notes:
+            # Verificar si es momento de cambiar a la siguiente nota
+            if current_time - self.last_note_change_time >= min(midi_parameters["note_duration"], MAX_DURATION):
+                current_idx = midi_parameters["current_note_idx"]
+                if current_idx >= len(song_notes):
+                    current_idx = 0
+                note, duration = song_notes[current_idx]
+
+                # Actualizar la frecuencia según la nota MIDI
+                frequency = note
+                midi_parameters["frequency"] = frequency
+
+                # Calcular el incremento basado en la frecuencia actual
+                self.increment = self.compute_incremento(midi_parameters["frequency"])
+
+                # Limitar la duración de la nota a un máximo de MAX_DURATION
+                midi_parameters["note_duration"] = min(duration, MAX_DURATION)
+                self.last_note_change_time = current_time
+
+                print(f"[INFO] Nota actual: {note} - Frecuencia: {frequency:.2f} Hz")
+
+                # Avanzar al siguiente índice de nota
+                midi_parameters["current_note_idx"] = current_idx + 1
+
+                # Reiniciar el índice si se llega al final de la canción
+                if midi_parameters["current_note_idx"] >= len(song_notes):
+                    midi_parameters["current_note_idx"] = 0
+
+    def handle_control_change(self, control, value):
+        """
+        Maneja los controles MIDI (knobs y sliders). Los cambios serán permanentes.
+        """
+        print(control, value)
+        midi_parameters = self.midi_parameters
+
+        if control == 72:
+            # Knob 1: Ajuste de escala
+            self.adjust_scale(value)
+        elif control == 16:
+            # Knob 2: Ajuste de rotación
+            self.adjust_rotation(value)
+        elif control == 79:
+            # Knob 3: Ajuste de distorsión
+            self.adjust_distortion(value)
+        elif control == 19:
+            # Knob 4: Ajuste de FPS
+            self.adjust_fps(value)
+        elif control == 91:
+            # Knob 5: Activar/desactivar la modulación por audio
+            self.set_audio_reactive(value >= 64)
+        elif control == 18:
+            # Knob 6: Sensibilidad de la modulación por audio (0 a 4)
+            self.audio_reactive_parameters["sensibilidad"] = (value / 127.0) * 4.0
+            print(f"[INFO] Sensibilidad de audio ajustada a: {self.audio_reactive_parameters['sensibilidad']:.2f}")
+        elif control == 17:
+            # Knob 7: Suavizado de la modulación por audio (0 a 0.99)
+            self.audio_reactive_parameters["suavizado"] = (value / 127.0) * 0.99
+            print(f"[INFO] Suavizado de audio ajustado a: {self.audio_reactive_parameters['suavizado']:.2f}")
+        elif control == 114:
+            # Knob 8: Cambio de animación con los golpes del audio
+            self.audio_reactive_parameters["cambio_animacion"] = value >= 64
+            print(f"[INFO] Cambio de animación por golpes: {'activado' if value >= 64 else 'desactivado'}")
+
+        # Slider 1 (control 75): Modo pausa
+        elif control == 75:
+            if value >= 64 and not midi_parameters["pause_mode"]:
+                midi_parameters["pause_mode"] = True
+                self.paused_frame_idx = self.frame_idx  # Almacenar el índice del frame actual
+                print(f"[INFO] Modo de pausa activado en el índice de frame: {self.paused_frame_idx}")
+            elif value < 64 and midi_parameters["pause_mode"]:
+                midi_parameters["pause_mode"] = False
+                print("[INFO] Modo de pausa desactivado.")
+
+        # Slider 2 (control 73): Modo canción
+        elif control == 73:
+            if value >= 64:
+                if not self.song_loaded:
+                    self.load_song()
+                midi_parameters["song_mode"] = True
+                midi_parameters["current_note_idx"] = 0
+                print("[INFO] Modo canción activado.")
+            else:
+                midi_parameters["song_mode"] = False
+                print("[INFO] Modo canción desactivado. Volviendo al modo normal.")
+
+        # Sliders 3 a 8 para seleccionar animaciones
+        elif control in SLIDER_ANIMATIONS:
+            animation_idx = SLIDER_ANIMATIONS[control]
+            if value >= 64 and animation_idx < len(self.files_npz):
+                self.video_parameters["selected_animation"] = animation_idx
+                print(f"[INFO] Animación {animation_idx + 1} seleccionada ({list(self.files_npz.keys())[animation_idx]}).")
+        else:
+            # Rango de frecuencias
+            FREQ_MIN = 0.2  # Hz
+            FREQ_MAX = 2000  # Hz
+            frequency = FREQ_MIN * (FREQ_MAX / FREQ_MIN) ** (value / 127)
+            midi_parameters['frequency'] = frequency
+            self.increment = self.compute_incremento(midi_parameters["frequency"])
+            print(f"Frecuencia ajustada a: {frequency} Hz")
+
+    def set_audio_reactive(self, enabled):
+        """
+        Activa o desactiva la modulación por audio a partir de la entrada de audio.
+        """
+        if enabled and self.audio_reactive is None:
+            from modulacion_audio import ModulacionAudio
+            self.audio_reactive = ModulacionAudio(self, self.audio_reactive_parameters)
+            try:
+                self.audio_reactive.start()
+            except Exception as e:
+                print(f"[ERROR] No se pudo abrir la entrada de audio: {e}")
+                self.audio_reactive = None
+        elif not enabled and self.audio_reactive is not None:
+            self.audio_reactive.stop()
+            self.audio_reactive = None
+
+    def adjust_fps(self, value):
+        """
+        Ajusta los FPS de la animación utilizando el Knob 4.
+        El rango de FPS es de 10 a 120.
+        """
+        # Mapea el valor del controlador (0-127) al rango de FPS (10-120)
+        min_fps = 10
+        max_fps = 120
+        fps = min_fps + (max_fps - min_fps) * (value / 127.0)
+        self.video_parameters["fps"] = int(fps)
+        print(f"[INFO] FPS ajustado a: {self.video_parameters['fps']}")
+
+    def adjust_scale(self, value):
+        """
+        Ajusta el escalado de la señal (visual y de audio).
+        """
+        # Escalar entre un mínimo (0.1) y un máximo (2.0)
+        self.scale = 0.1 + (1.9 * value) / 127
+        print(f"[INFO] Escalado ajustado a: {self.scale:.2f}")
+
+    def adjust_rotation(self, value):
+        """
+        Ajusta la rotación de la animación.
+        """
+        # Rotar de 0 a 360 grados según el valor del controlador
+        self.rotation = (value / 127.0) * 360.0
+        print(f"[INFO] Rotación ajustada a: {self.rotation:.2f} grados")
+
+    def adjust_distortion(self, value):
+        """
+        Ajusta la distorsión de la señal.
+        """
+        # Distorsión ajustada entre 0 (sin distorsión) y 0.8 (máxima distorsión controlada)
+        self.distortion = (value / 127.0) * 0.8
+        print(f"[INFO] Distorsión ajustada a: {self.distortion:.2f}")
+
+    def apply_effects(self, frame, scale_factor=1.0, rotation_degrees=0, distortion_level=0):
+        """
+        Aplica escalado, rotación, inversión del eje Y, distorsión y normalización a un frame con optimizaciones.
+        """
+        # 1. Aplicar escalado con un valor mínimo
+        frame_scaled = frame * scale_factor
+
+        # 2. Invertir el eje Y para corregir la orientación
+        frame_scaled[:, 1] *= -1
+
+        # 3. Calcular la matriz de rotación solo si el ángulo ha cambiado
+        if rotation_degrees != self.last_rotation:
+            radians = np.deg2rad(rotation_degrees)
+            cos_theta = np.cos(radians)
+            sin_theta = np.sin(radians)
+            self.rotation_matrix = np.array([[cos_theta, -sin_theta], [sin_theta, cos_theta]], dtype=self.dtype)
+            self.last_rotation = rotation_degrees
+
+        # 4. Aplicar rotación usando la matriz cacheada
+        frame_rotated = np.dot(frame_scaled, self.rotation_matrix)
+
+        # 5. Aplicar distorsión suavizada
+        if distortion_level > 0:
+            gain = 5 * distortion_level
+            frame_distorted = np.tanh(gain * frame_rotated)
+        else:
+            frame_distorted = frame_rotated
 
-            for name, file in files_npz.items():
-                # Cargar cada archivo y almacenarlo en la caché
-                animation_cache[name] = load_animation(file)
-                print(f"[INFO] Animación '{name}' cargada exitosamente.")
+        # 6. Normalizar la señal para evitar cambios en el volumen
+        max_val = np.max(np.abs(frame_distorted))
+        if max_val > 0:
+            frame_normalized = frame_distorted / max_val
+        else:
+            frame_normalized = frame_distorted
+
+        return frame_normalized
+
+    def get_audio_buffer_from_wave(self, bits_idx, incr, tabla_datos_xy, tabla_siguiente=None, blend_start=0, frame_len=None):
+        """
+        LLena el buffer de audio desde la tabla de ondas, calculando todo el bloque de una vez.
+        Si se indica una tabla siguiente, interpola linealmente entre ambas tablas a lo largo
+        del intervalo del frame de frame_len muestras (morphing), empezando en la muestra blend_start.
+        Si no hay datos en la tabla, llena el buffer con ceros.
+        """
+        buffer_len = self.midi_parameters["audio_buffer_len"]
+
+        if tabla_datos_xy is None or len(tabla_datos_xy) == 0:
+            # Si no hay datos en la tabla, devuelve silencio (buffer lleno de ceros)
+            return np.zeros((buffer_len, 2), dtype=self.dtype)
+
+        # Índices de la tabla para todas las muestras del bloque
+        bit_shift = 32 - bits_idx
+        phasors = (self.phasor + incr * self.sample_ramp) & 0xFFFFFFFF
+        idx = (phasors >> bit_shift) % len(tabla_datos_xy)  # Envolver el índice si es mayor
+        self.phasor = (self.phasor + incr * buffer_len) & 0xFFFFFFFF
+
+        lr_channel = tabla_datos_xy[idx]  # Copia nueva: se puede modificar en el sitio
+        max_val = np.max(np.abs(tabla_datos_xy))
 
-            # Notificar que la caché está lista
-            elapsed_time = time.time() - start_time
-            print(f"[INFO] Caché creada exitosamente en {elapsed_time:.2f} segundos.")
-            data_processed_event.set()  # Activar el evento para notificar que la caché está lista
-            break
+        if tabla_siguiente is not None and len(tabla_siguiente) > 0:
+            # Peso de la tabla siguiente para cada muestra: 0 al inicio del frame, 1 al final
+            if frame_len is None:
+                frame_len = self.midi_parameters["FREQ_SAMPLE"] / self.video_parameters["fps"]
+            np.add(self.blend_ramp, self.sample_counter - blend_start, out=self.blend)
+            self.blend *= 1.0 / frame_len
+            np.clip(self.blend, 0.0, 1.0, out=self.blend)
+            siguiente = tabla_siguiente[idx % len(tabla_siguiente)]
+            siguiente -= lr_channel
+            siguiente *= self.blend[:, np.newaxis]
+            lr_channel += siguiente
+            max_val = max(max_val, np.max(np.abs(tabla_siguiente)))
 
-        except Exception as e:
-            print(f"[ERROR] Error en el hilo de análisis: {e}")
-            break
+        if max_val > 0:
+            lr_channel /= max_val
 
-    
-def playback_thread():
-    """
-    Hilo de reproducción de audio, que reproduce los frames de la animación en el osciloscopio.
-    """
-    global exit_flag, current_wave, frame_idx, increment, paused_frame_idx
-
-    increment = compute_incremento(midi_parameters["frequency"])
-    data_processed_event.wait()
-
-    # Inicializar el stream de audio solo una vez
-    try:
-        stream = sd.OutputStream(
-            channels=midi_parameters["NUM_CHANNELS"],
-            callback=callback,
-            samplerate=midi_parameters["FREQ_SAMPLE"],
-            blocksize=midi_parameters["audio_buffer_len"],
-            device=midi_parameters["AUDIO_DEVICE"]
-        )
-        with stream:
-            previous_animation = video_parameters["selected_animation"]
-
-            while not exit_flag:
-                # Recalcular el intervalo de tiempo para los FPS dinámicamente
-                fps_interval = 1.0 / video_parameters["fps"]
-
-                # Obtener el nombre de la animación seleccionada dinámicamente
-                selected_animation_name = list(files_npz.keys())[video_parameters["selected_animation"]]
-
-                # Verificar si la animación ha cambiado
-                if video_parameters["selected_animation"] != previous_animation:
-                    print(f"[INFO] Cambio de animación detectado. Nueva animación: {selected_animation_name}")
-                    frame_idx = 0  # Reiniciar el índice de frame
-                    previous_animation = video_parameters["selected_animation"]
-
-                # Verificar si la animación está en la caché
-                if selected_animation_name in animation_cache:
-                    animation_data = animation_cache[selected_animation_name]
-                    frames = [np.array(frame, dtype=np.float64) for frame in animation_data.values()]
-
-                    # Verificar que frame_idx no exceda el número de frames
-                    if frame_idx >= len(frames):
-                        frame_idx = 0
-
-                    if midi_parameters["pause_mode"]:
-                        # Reproducir el frame pausado
-                        current_wave = apply_effects(frames[paused_frame_idx], scale_factor=scale, rotation_degrees=rotation, distortion_level=distortion)
-                    else:
-                        # Modo canción: actualizar la frecuencia automáticamente
-                        if midi_parameters["song_mode"]:
-                            play_song()
+        return lr_channel
 
-                        # Reproducción normal de la animación
-                        current_wave = apply_effects(frames[frame_idx], scale_factor=scale, rotation_degrees=rotation, distortion_level=distortion)
-                        frame_idx += 1
+    def callback(self, outdata, frames, time_info, status):
+        """
+        Callback para el stream de audio.
+        """
+        callback_start = time.perf_counter()
+        midi_parameters = self.midi_parameters
 
-                else:
-                    print(f"[ERROR] La animación '{selected_animation_name}' no está disponible en la caché.")
+        if status:
+            self.callback_stats["xruns"] += 1
+            print(status)
 
-                # Esperar el intervalo calculado para el nuevo FPS
-                time.sleep(fps_interval)
+        if self.exit_flag:
+            outdata.fill(0)
+        else:
+            # Actualizar el incremento según la frecuencia actual
+            self.increment = self.compute_incremento(midi_parameters["frequency"])
+
+            # Obtener el buffer de audio normalizado (con morphing entre frames si está activo)
+            waves = self.morph_waves
+            if self.video_parameters["morph"] and waves is not None:
+                wave, next_wave, blend_start, frame_len = waves
+                audio_buffer = normalize(self.get_audio_buffer_from_wave(midi_parameters["n_bits_phasor"], self.increment, wave, next_wave, blend_start, frame_len))
+            else:
+                audio_buffer = normalize(self.get_audio_buffer_from_wave(midi_parameters["n_bits_phasor"], self.increment, self.current_wave))
+            self.sample_counter += frames
+
+            if midi_parameters["NUM_CHANNELS"] == 2:
+                # Modo PC_SPEAKERS: Salida estéreo
+                outdata[:, 0] = audio_buffer[:, 0]  # Canal izquierdo
+                outdata[:, 1] = audio_buffer[:, 1]  # Canal derecho
+
+            elif midi_parameters["NUM_CHANNELS"] == 8:
+                # Modo AUDIO_INTERFACE: Salida multicanal
+                outdata[:, 0:2] = audio_buffer  # Canales 1 y 2 (osciloscopio)
+                outdata[:, 2:4] = audio_buffer  # Canales 3 y 4 (altavoces)
+                outdata[:, 4:] = 0
+
+            else:
+                raise ValueError("Número de canales no válido.")
+
+        self.callback_stats["max_duration"] = max(self.callback_stats["max_duration"], time.perf_counter() - callback_start)
+
+    def stop_program(self):
+        """
+        Detiene todos los hilos y el programa principal
+        """
+        self.exit_flag = True
+        print("[INFO] El programa se está cerrando...")
+        try:
+            self.backend.stop()
+        except Exception as e:
+            print(f"[ERROR] No se pudo detener el stream de audio: {e}")
+
+    def compute_incremento(self, freq):
+        """
+        Calcula el incremento del fasor basado en la frecuencia deseada.
+        """
+        incremento = int(pow(2, 32) * float(freq) / self.midi_parameters["FREQ_SAMPLE"])
+        return incremento
+
+
+    # ---------------------------- ESTRUCTURA DE HILOS -----------------------------
+
+    def analysis_thread(self):
+        """
+        Hilo que carga la animación seleccionada y lanza la precarga del resto.
+        """
+        while not self.exit_flag:
+            try:
+                print("[INFO] Cargando animación inicial...")
+                start_time = time.time()
+
+                self.animation_manager.start()
+
+                # Solo la animación seleccionada se carga de forma síncrona
+                names = list(self.files_npz.keys())
+                selected_name = names[self.video_parameters["selected_animation"]]
+                self.animation_manager.select(selected_name)
+                try:
+                    self.animation_manager.load(selected_name)
+                except Exception as e:
+                    # La reproducción arranca igualmente y mantiene el último frame, como cuando
+                    # falla la carga de una animación al cambiar de selección
+                    self.animation_manager.mark_failed(selected_name)
+                    print(f"[ERROR] No se pudo cargar la animación inicial '{selected_name}': {e}")
+                else:
+                    elapsed_time = time.time() - start_time
+                    print(f"[INFO] Animación inicial lista en {elapsed_time:.2f} segundos.")
+
+                # Notificar que la reproducción puede comenzar
+                self.data_processed_event.set()  # Activar el evento para notificar que la animación está lista
+
+                # Precargar en segundo plano las animaciones asignadas a los sliders
+                self.animation_manager.prefetch(names[idx] for idx in SLIDER_ANIMATIONS.values() if idx < len(names))
+                break
+
+            except Exception as e:
+                print(f"[ERROR] Error en el hilo de análisis: {e}")
+                self.data_processed_event.set()  # No dejar bloqueados los hilos que esperan la carga
+                break
+
+    def effected_frame(self, frames, idx):
+        """
+        Devuelve el frame idx con los efectos aplicados, reutilizando la tabla calculada
+        en un tick anterior si la animación y los efectos no han cambiado.
+        """
+        effects = (self.scale, self.rotation, self.distortion)
+        cache = self.wave_cache
+        if cache is None or cache[0] is not frames or cache[1] != effects:
+            cache = self.wave_cache = (frames, effects, {})
+        waves = cache[2]
+        if idx not in waves:
+            waves[idx] = self.apply_effects(frames[idx], scale_factor=self.scale, rotation_degrees=self.rotation, distortion_level=self.distortion)
+        return waves[idx]
+
+    def advance_frame(self, frames, frame_rate=None, elapsed=None):
+        """
+        Publica la tabla de ondas del frame actual de la animación y avanza la posición.
+        Si se conocen los FPS con los que se guardó la animación (frame_rate), la posición avanza
+        según el tiempo transcurrido (elapsed, por defecto un intervalo de fps) a frame_rate
+        escalado por fps / REFERENCE_FPS: a REFERENCE_FPS se respeta la velocidad original aunque
+        se hayan guardado menos frames, y el knob de FPS sigue controlando la velocidad.
+        Si no, avanza un frame por llamada.
+        """
+        midi_parameters = self.midi_parameters
+        fps = self.video_parameters["fps"]
+        if frame_rate is not None:
+            frame_rate *= fps / REFERENCE_FPS  # Frames guardados por segundo a la velocidad actual
+
+        # Verificar que la posición no exceda el número de frames
+        if self.frame_position >= len(frames):
+            self.frame_position %= len(frames)
+        self.frame_idx = int(self.frame_position)
+
+        if midi_parameters["pause_mode"]:
+            # Reproducir el frame pausado (la animación puede haberse recargado con menos frames)
+            self.current_wave = self.apply_effects(frames[min(self.paused_frame_idx, len(frames) - 1)], scale_factor=self.scale, rotation_degrees=self.rotation, distortion_level=self.distortion)
+            self.morph_waves = None
+        else:
+            # Modo canción: actualizar la frecuencia automáticamente
+            if midi_parameters["song_mode"]:
+                self.play_song()
+
+            # Reproducción normal de la animación
+            self.current_wave = self.effected_frame(frames, self.frame_idx)
+
+            # Morphing: publicar el frame actual y el siguiente para que el callback interpole entre ambos
+            if self.video_parameters["morph"]:
+                next_idx = (self.frame_idx + 1) % len(frames)
+                next_wave = self.effected_frame(frames, next_idx)
+
+                if frame_rate is None:
+                    # Un frame guardado por tick: la mezcla dura un intervalo de fps
+                    frame_len = midi_parameters["FREQ_SAMPLE"] / fps
+                    blend_start = self.sample_counter
+                else:
+                    # La mezcla sigue la duración real del frame guardado, partiendo de la fracción ya recorrida
+                    frame_len = midi_parameters["FREQ_SAMPLE"] / frame_rate
+                    blend_start = self.sample_counter - (self.frame_position - self.frame_idx) * frame_len
+                self.morph_waves = (self.current_wave, next_wave, blend_start, frame_len)
+            else:
+                self.morph_waves = None
+
+            # Conservar solo las tablas que pueden volver a usarse en el siguiente tick
+            waves = self.wave_cache[2]
+            for idx in [idx for idx in waves if idx not in (self.frame_idx, (self.frame_idx + 1) % len(frames))]:
+                del waves[idx]
+
+            if frame_rate is None:
+                self.frame_position += 1
+            else:
+                self.frame_position += frame_rate * (elapsed if elapsed is not None else 1.0 / fps)
+
+    def playback_thread(self):
+        """
+        Hilo de reproducción de audio, que reproduce los frames de la animación en el osciloscopio.
+        """
+        midi_parameters = self.midi_parameters
+        video_parameters = self.video_parameters
+
+        self.increment = self.compute_incremento(midi_parameters["frequency"])
+        self.data_processed_event.wait()
+
+        # Inicializar el stream de audio solo una vez
+        try:
+            stream = self.backend.output_stream(
+                channels=midi_parameters["NUM_CHANNELS"],
+                callback=self.callback,
+                samplerate=midi_parameters["FREQ_SAMPLE"],
+                blocksize=midi_parameters["audio_buffer_len"],
+                device=midi_parameters["AUDIO_DEVICE"],
+                dtype=self.dtype.name
+            )
+            with stream:
+                previous_animation = video_parameters["selected_animation"]
+                missing_animation = None  # (animación que falta, si su carga falló), para no repetir el aviso
+                last_tick = time.perf_counter()
+
+                while not self.exit_flag:
+                    # Recalcular el intervalo de tiempo para los FPS dinámicamente
+                    fps_interval = 1.0 / video_parameters["fps"]
+
+                    # Obtener el nombre de la animación seleccionada dinámicamente
+                    selected_animation_name = list(self.files_npz.keys())[video_parameters["selected_animation"]]
+
+                    # Verificar si la animación ha cambiado
+                    if video_parameters["selected_animation"] != previous_animation:
+                        print(f"[INFO] Cambio de animación detectado. Nueva animación: {selected_animation_name}")
+                        self.frame_position = 0.0  # Reiniciar la posición en la animación
+                        previous_animation = video_parameters["selected_animation"]
+
+                    # Obtener la animación de la caché (si no está, se carga en segundo plano)
+                    self.animation_manager.select(selected_animation_name)
+                    frames = self.animation_manager.get(selected_animation_name)
+                    now = time.perf_counter()
+                    elapsed, last_tick = now - last_tick, now
+                    if frames is not None:
+                        missing_animation = None
+                        self.advance_frame(frames, self.animation_manager.frame_rate(selected_animation_name), elapsed)
 
-    except Exception as e:
-        print(f"[ERROR] Error al iniciar la reproducción de audio: {e}")
+                    else:
+                        # Mantener el último frame mientras la animación se carga (o si no se pudo cargar)
+                        self.morph_waves = None
+                        failed = self.animation_manager.has_failed(selected_animation_name)
+                        if missing_animation != (selected_animation_name, failed):
+                            if failed:
+                                print(f"[ERROR] No se pudo cargar la animación '{selected_animation_name}'. Manteniendo el último frame.")
+                            else:
+                                print(f"[INFO] La animación '{selected_animation_name}' se está cargando. Manteniendo el último frame.")
+                            missing_animation = (selected_animation_name, failed)
+
+                    # Esperar el intervalo calculado para el nuevo FPS
+                    time.sleep(fps_interval)
 
-    print("[INFO] Hilo de reproducción terminado.")
+        except Exception as e:
+            print(f"[ERROR] Error al iniciar la reproducción de audio: {e}")
 
+        self.animation_manager.stop()
+        self.set_audio_reactive(False)
+        print("[INFO] Hilo de reproducción terminado.")
 
+    def parameters_thread(self, port_name):
+        """
+        Hilo que recibe mensajes MIDI y ajusta los parámetros del motor.
+        """
+        self.data_processed_event.wait() # Esperar a que la animación inicial esté cargada
+        print(f"Abriendo puerto MIDI: {port_name}")
+        inport = self.backend.open_midi_input(port_name)
 
-def parameters_thread(port_name):
-    """
-    Hilo que recibe mensajes MIDI y ajusta los parámetros globales.
-    """
-    global increment
-
-    data_processed_event.wait() # Esperar a que
-    print(f"Abriendo puerto MIDI: {port_name}")
-    inport = mido.open_input(port_name)
-
-    try:
-        while not exit_flag:
-            fps_interval = 1.0/video_parameters["fps"]
-            for msg in inport.iter_pending():
-                if msg.type == 'note_on' and msg.velocity > 0:
-                    # Ajustar frecuencia según la nota tocada
-                    frequency = midi_note_to_frequency(msg.note)
-                    midi_parameters['frequency'] = frequency
-                    increment = compute_incremento(midi_parameters["frequency"])
-                    print(f"Frecuencia ajustada a: {frequency} Hz")
-                elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
-                    pass
-                elif msg.type == 'control_change':
-                    control = msg.control
-                    value = msg.value
-                    handle_control_change(control, value)
-                else: 
-                    pass
-            time.sleep(fps_interval)
-
-    except KeyboardInterrupt:
-        print("Interrumpido por el usuario. Cerrando el puerto MIDI.")
-    finally:
-        inport.close()
-        print(f"[INFO] Puerto MIDI {port_name} cerrado.")
-
-def keyboard_listener_thread():
-    """
-    Hilo para detectar la pulsación de 'Escape' y otras teclas del teclado
-    """
+        try:
+            while not self.exit_flag:
+                fps_interval = 1.0/self.video_parameters["fps"]
+                for msg in inport.iter_pending():
+                    if msg.type == 'note_on' and msg.velocity > 0:
+                        # Ajustar frecuencia según la nota tocada
+                        frequency = midi_note_to_frequency(msg.note)
+                        self.midi_parameters['frequency'] = frequency
+                        self.increment = self.compute_incremento(self.midi_parameters["frequency"])
+                        print(f"Frecuencia ajustada a: {frequency} Hz")
+                    elif msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0):
+                        pass
+                    elif msg.type == 'control_change':
+                        control = msg.control
+                        value = msg.value
+                        self.handle_control_change(control, value)
+                    else:
+                        pass
+                time.sleep(fps_interval)
 
-    global exit_flag
-    print("[INFO] Presiona 'Esc' para finalizar el programa.")
-    keyboard.add_hotkey('esc', stop_program)
+        except KeyboardInterrupt:
+            print("Interrumpido por el usuario. Cerrando el puerto MIDI.")
+        finally:
+            inport.close()
+            print(f"[INFO] Puerto MIDI {port_name} cerrado.")
+
+    def scan_assets(self, directory):
+        """
+        Devuelve un diccionario ruta -> fecha de modificación de las animaciones
+        (.npz y .svg) del directorio y del archivo MIDI.
+        """
+        mtimes = {}
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith((".npz", ".svg")):
+                mtimes[os.path.normpath(entry.path)] = entry.stat().st_mtime
+        if os.path.exists(self.midi_file):
+            mtimes[os.path.normpath(self.midi_file)] = os.path.getmtime(self.midi_file)
+        return mtimes
+
+    def reload_asset(self, path):
+        """
+        Recarga un único archivo modificado y publica el resultado en el motor en marcha.
+        """
+        if os.path.normpath(path) == os.path.normpath(self.midi_file):
+            # La nueva canción se publica con una única asignación
+            song_notes = analyze_midi_melody(self.midi_file)
+            self.midi_parameters["song_notes"] = song_notes
+            self.song_loaded = True
+            print(f"[INFO] Canción '{self.midi_file}' recargada ({len(song_notes)} notas).")
+
+        elif path.endswith(".svg"):
+            # Reprocesar la animación; el .npz resultante se recarga en la siguiente comprobación
+            from preprocesado_animaciones import procesa_multiples_animaciones
+            procesa_multiples_animaciones([path], self.midi_parameters["TABLE_SIZE"])
+            print(f"[INFO] Animación '{path}' reprocesada.")
 
-    while not exit_flag:
-        time.sleep(0.1)
+        else:
+            name = animation_name(path)
+            if name not in self.files_npz:
+                # Nueva animación: solo se añade al final de la lista si se ha podido cargar
+                self.animation_manager.load(name, force=True, file=path)
+                self.files_npz[name] = path
+                print(f"[INFO] Nueva animación '{name}' disponible (índice {len(self.files_npz) - 1}).")
+            else:
+                self.animation_manager.load(name, force=True)
+
+    def reload_watcher_thread(self, directory):
+        """
+        Hilo que vigila el directorio de animaciones y el archivo MIDI, y recarga solo
+        los archivos modificados sin detener el stream de audio.
+        """
+        self.data_processed_event.wait()
+        known_assets = self.scan_assets(directory)
+
+        while not self.exit_flag:
+            time.sleep(RELOAD_POLL_INTERVAL)
+            for path, mtime in self.scan_assets(directory).items():
+                if known_assets.get(path) == mtime:
+                    continue
+
+                # Reiniciar las estadísticas del callback para medir la perturbación de la recarga
+                xruns_before = self.callback_stats["xruns"]
+                self.callback_stats["max_duration"] = 0.0
+                start_time = time.perf_counter()
+
+                try:
+                    self.reload_asset(path)
+                except Exception as e:
+                    # Se reintentará cuando el archivo vuelva a cambiar (p. ej. al terminar de escribirse)
+                    print(f"[ERROR] No se pudo recargar '{path}': {e}")
+                    known_assets[path] = mtime
+                    continue
+
+                known_assets[path] = mtime
+                elapsed_time = time.perf_counter() - start_time
+                print(f"[INFO] Recarga de '{path}' publicada en {elapsed_time * 1000:.1f} ms "
+                      f"(callback máx. {self.callback_stats['max_duration'] * 1000:.2f} ms, "
+                      f"xruns: {self.callback_stats['xruns'] - xruns_before}).")
+
+    def keyboard_listener_thread(self):
+        """
+        Hilo para detectar la pulsación de 'Escape' y otras teclas del teclado
+        """
+        print("[INFO] Presiona 'Esc' para finalizar el programa.")
+        self.backend.add_hotkey('esc', self.stop_program)
+
+        while not self.exit_flag:
+            time.sleep(0.1)
+
+    def run(self, port_name=MIDI_PORT, watch_dir=ANIMATION_DIR):
+        """
+        Lanza todos los hilos del motor y espera a que termine la reproducción.
+        """
+        start_time = time.time()
+
+        # Creación de los hilos
+        analysis = threading.Thread(target=self.analysis_thread)
+        playback = threading.Thread(target=self.playback_thread)
+        keyboard_listener = threading.Thread(target=self.keyboard_listener_thread, daemon=True)
+        midi_listener = threading.Thread(target=self.parameters_thread, args=(port_name,), daemon=True)
+        reload_watcher = threading.Thread(target=self.reload_watcher_thread, args=(watch_dir,), daemon=True)
+
+        keyboard_listener.start()
+        midi_listener.start()
+        reload_watcher.start()
+        analysis.start()
+        playback.start()
+
+        # Esperar a que los hilos terminen
+        analysis.join()
+        playback.join()
+
+        if self.exit_flag:
+            end_time = time.time()
+            elapsed_time = end_time - start_time
+            print(f"[INFO] Programa finalizado en {elapsed_time} segundos.")
 
 
 
 
 """
------------- EJECUCIÓN DEL PROGRAMA PRINCIPAL ------------ 
+------------ EJECUCIÓN DEL PROGRAMA PRINCIPAL ------------
 """
 
 def main():
-    start_time = time.time()
-
-    # Creación de los hilos
-    analysis = threading.Thread(target=analysis_thread, args=(files_npz,))
-    playback = threading.Thread(target=playback_thread)
-    keyboard_listener = threading.Thread(target=keyboard_listener_thread, daemon=True)
-    midi_listener = threading.Thread(target=parameters_thread, args=('WORLDE    0',), daemon=True)
-
-    keyboard_listener.start()
-    midi_listener.start()
-    analysis.start()
-    playback.start()
-
-    # Esperar a que los hilos terminen
-    analysis.join()
-    playback.join()
-
-    if exit_flag:
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        print(f"[INFO] Programa finalizado en {elapsed_time} segundos.")
+    engine = OsciEngine()
+    engine.run()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,153 @@
+import hashlib
+import os
+import numpy as np
+
+# Directorio y versión de la caché de canciones compiladas
+CACHE_DIR = ".midi_cache"
+CACHE_VERSION = 1
+
+DEFAULT_TEMPO = 500000  # Microsegundos por negra (120 BPM)
+PERCUSSION_CHANNEL = 9  # Canal 10 de General MIDI (batería)
+
+
+# Calcula el hash SHA-1 del contenido de un archivo
+def hash_archivo(ruta):
+    sha1 = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(bloque)
+    return sha1.hexdigest()
+
+
+# Extrae los eventos de una pista como arrays: ticks absolutos, tipo, nota, velocidad, canal y tempo
+def eventos_pista(pista):
+    deltas = np.fromiter((msg.time for msg in pista), dtype=np.int64, count=len(pista))
+    ticks = np.cumsum(deltas)
+
+    indices_notas = [i for i, msg in enumerate(pista) if msg.type in ("note_on", "note_off")]
+    indices_tempo = [i for i, msg in enumerate(pista) if msg.type == "set_tempo"]
+
+    notas = np.array([(pista[i].type == "note_on", pista[i].note, pista[i].velocity, pista[i].channel)
+                      for i in indices_notas], dtype=np.int64).reshape(-1, 4)
+    tempos = np.array([pista[i].tempo for i in indices_tempo], dtype=np.int64)
+
+    return ticks[indices_notas], notas, ticks[indices_tempo], tempos
+
+
+# Construye el mapa de tempo combinado de todas las pistas y convierte ticks a segundos
+def ticks_a_segundos(ticks, ticks_tempo, tempos, ticks_per_beat):
+    orden = np.argsort(ticks_tempo, kind="stable")
+    inicio_tramo = np.concatenate(([0], ticks_tempo[orden]))
+    tempo_tramo = np.concatenate(([DEFAULT_TEMPO], tempos[orden])).astype(np.float64)
+
+    # Segundos acumulados al inicio de cada tramo de tempo
+    segundos_por_tick = tempo_tramo / 1_000_000 / ticks_per_beat
+    segundos_tramo = np.concatenate(([0.0], np.cumsum(np.diff(inicio_tramo) * segundos_por_tick[:-1])))
+
+    tramo = np.searchsorted(inicio_tramo, ticks, side="right") - 1
+    return segundos_tramo[tramo] + (ticks - inicio_tramo[tramo]) * segundos_por_tick[tramo]
+
+
+# Empareja note_on/note_off de todas las pistas y devuelve los arrays de la canción
+def compila_notas(midi_data):
+    ticks_notas, notas, ticks_tempo, tempos = [], [], [], []
+    for pista in midi_data.tracks:
+        t_notas, n, t_tempo, tmp = eventos_pista(pista)
+        ticks_notas.append(t_notas)
+        notas.append(n)
+        ticks_tempo.append(t_tempo)
+        tempos.append(tmp)
+
+    ticks = np.concatenate(ticks_notas)
+    notas = np.vstack(notas)
+    ticks_tempo = np.concatenate(ticks_tempo)
+    tempos = np.concatenate(tempos)
+
+    # Un note_on con velocidad 0 equivale a un note_off
+    es_on = (notas[:, 0] == 1) & (notas[:, 2] > 0)
+    clave = notas[:, 3] * 128 + notas[:, 1]
+
+    # Ordenar por (canal, nota), tick y, en el mismo tick, los note_off antes que los note_on
+    orden = np.lexsort((es_on, ticks, clave))
+    ticks, notas, es_on, clave = ticks[orden], notas[orden], es_on[orden], clave[orden]
+    tick_final = ticks.max() if len(ticks) else 0
+
+    pos_on = np.flatnonzero(es_on)
+    pos_off = np.flatnonzero(~es_on)
+
+    # Cada nota termina en el siguiente note_off de la misma clave...
+    k = np.searchsorted(pos_off, pos_on)
+    siguiente_off = pos_off[np.minimum(k, len(pos_off) - 1)] if len(pos_off) else pos_on
+    valido = (k < len(pos_off)) & (clave[siguiente_off] == clave[pos_on])
+    fin = np.where(valido, ticks[siguiente_off], tick_final)
+
+    # ...o en el siguiente note_on de la misma clave, si llega antes
+    siguiente_on = np.append(pos_on[1:], pos_on[-1]) if len(pos_on) else pos_on
+    reactivada = np.append(clave[pos_on[1:]] == clave[pos_on[:-1]], False) if len(pos_on) else es_on[pos_on]
+    fin = np.where(reactivada, np.minimum(fin, ticks[siguiente_on]), fin)
+
+    onsets = ticks_a_segundos(ticks[pos_on], ticks_tempo, tempos, midi_data.ticks_per_beat)
+    offsets = ticks_a_segundos(fin, ticks_tempo, tempos, midi_data.ticks_per_beat)
+
+    # Ordenar las notas por instante de inicio para el secuenciador
+    orden = np.argsort(onsets, kind="stable")
+    return {
+        "onsets": onsets[orden],
+        "offsets": offsets[orden],
+        "pitches": notas[pos_on, 1][orden].astype(np.uint8),
+        "velocities": notas[pos_on, 2][orden].astype(np.uint8),
+        "channels": notas[pos_on, 3][orden].astype(np.uint8),
+    }
+
+
+# Compila un archivo MIDI a arrays de NumPy, usando la caché en disco si el archivo no ha cambiado
+def compila_midi(midi_file, cache_dir=CACHE_DIR, verbose=False):
+    ruta_cache = os.path.join(cache_dir, f"{hash_archivo(midi_file)}_v{CACHE_VERSION}.npz")
+
+    if os.path.exists(ruta_cache):
+        with np.load(ruta_cache) as data:
+            cancion = {key: data[key] for key in data.files}
+        if verbose:
+            print(f"Canción '{midi_file}' cargada de la caché: {ruta_cache}")
+        return cancion
+
+    import mido
+    cancion = compila_notas(mido.MidiFile(midi_file))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    ruta_temporal = ruta_cache + ".tmp.npz"
+    np.savez(ruta_temporal, **cancion)
+    os.replace(ruta_temporal, ruta_cache)  # Escritura atómica para no dejar cachés a medias
+
+    if verbose:
+        print(f"Canción '{midi_file}' compilada con {len(cancion['onsets'])} notas: {ruta_cache}")
+    return cancion
+
+
+# Devuelve el rango [inicio, fin) de notas que empiezan dentro de un bloque de tiempo
+def notas_en_bloque(cancion, t_inicio, t_fin):
+    inicio, fin = np.searchsorted(cancion["onsets"], [t_inicio, t_fin], side="left")
+    return int(inicio), int(fin)
+
+
+# Extrae la melodía principal (nota más aguda en cada inicio) como lista de (frecuencia, duración)
+def melodia(cancion, max_frequency=2000.0, min_duration=0.05, max_duration=5.0):
+    melodicas = cancion["channels"] != PERCUSSION_CHANNEL
+    onsets = cancion["onsets"][melodicas]
+    offsets = cancion["offsets"][melodicas]
+    pitches = cancion["pitches"][melodicas].astype(np.float64)
+    if len(onsets) == 0:
+        return []
+
+    # Para cada instante de inicio, quedarse con la nota más aguda
+    orden = np.lexsort((pitches, onsets))
+    onsets, offsets, pitches = onsets[orden], offsets[orden], pitches[orden]
+    ultima = np.flatnonzero(np.diff(onsets, append=np.inf) != 0)
+    onsets, offsets, pitches = onsets[ultima], offsets[ultima], pitches[ultima]
+
+    # Cada nota dura hasta su note_off o hasta la siguiente nota de la melodía
+    fin = np.minimum(offsets, np.append(onsets[1:], np.inf))
+    duraciones = np.clip(fin - onsets, min_duration, max_duration)
+    frecuencias = np.minimum(440.0 * (2.0 ** ((pitches - 69) / 12.0)), max_frequency)
+
+    return list(zip(frecuencias.tolist(), duraciones.tolist()))
@@ -0,0 +1,286 @@
+import queue
+import threading
+import time
+import wave
+import numpy as np
+
+# Bandas de frecuencia analizadas (Hz)
+BANDAS = {
+    "graves": (20.0, 250.0),
+    "medios": (250.0, 2000.0),
+    "agudos": (2000.0, 8000.0)
+}
+
+# Rango de cada parámetro del motor (los mismos que los knobs MIDI)
+RANGOS = {
+    "scale": (0.1, 2.0),
+    "rotation": (0.0, 360.0),
+    "distortion": (0.0, 0.8),
+    "fps": (10, 120)
+}
+
+# Parámetros por defecto de la modulación por audio
+DEFAULT_PARAMETROS_MODULACION = {
+    "fft_size": 2048,            # Tamaño de la ventana de análisis
+    "blocksize": 512,            # Muestras por bloque del stream de entrada
+    "device": None,              # Dispositivo de entrada (None: el predeterminado)
+    "suavizado": 0.8,            # Suavizado exponencial de los niveles (0: sin suavizado)
+    "sensibilidad": 1.0,         # Ganancia aplicada a los niveles normalizados
+    "umbral_onset": 1.5,         # Factor sobre el flujo espectral medio para detectar un golpe
+    "cambio_animacion": False,   # Cambiar de animación en cada golpe
+    "intervalo_cambio": 0.5,     # Tiempo mínimo entre cambios de animación, en segundos
+    "mapeo": {                   # Parámetro del motor -> banda que lo controla (None: desactivado)
+        "scale": "graves",
+        "rotation": "medios",
+        "distortion": "agudos",
+        "fps": None
+    }
+}
+
+HISTORIAL_ONSET = 43   # Bloques de flujo espectral usados para el umbral adaptativo (~0.5 s)
+FLUJO_MINIMO_RELATIVO = 0.1  # Flujo mínimo de un golpe, como fracción de la magnitud total del bloque
+FLUJO_MINIMO_ABSOLUTO = 1.0  # Flujo mínimo de un golpe en magnitud absoluta (descarta el silencio)
+DECAIMIENTO_PICOS = 0.999  # Olvido del máximo de cada banda para la normalización adaptativa
+
+
+class AnalizadorEspectral:
+    """
+    FFT enventanada por bloques con buffers preasignados. Devuelve la energía de cada
+    banda y si el bloque contiene un golpe (onset) según el flujo espectral.
+    """
+
+    def __init__(self, freq_sample, fft_size=2048, bandas=BANDAS):
+        self.fft_size = fft_size
+        self.nombres_bandas = list(bandas.keys())
+
+        self.muestras = np.zeros(fft_size)
+        self.ventana = np.hanning(fft_size)
+        self.enventanado = np.zeros(fft_size)
+
+        n_bins = fft_size // 2 + 1
+        self.magnitudes = np.zeros(n_bins)
+        self.magnitudes_previas = np.zeros(n_bins)
+        self.diferencia = np.zeros(n_bins)
+        self.potencia = np.zeros(n_bins)
+        self.acumulada = np.zeros(n_bins + 1)  # Suma acumulada con un cero inicial
+
+        # Índices de los bins de cada banda
+        freqs = np.fft.rfftfreq(fft_size, 1.0 / freq_sample)
+        self.inicio_bandas = np.searchsorted(freqs, [lo for lo, hi in bandas.values()])
+        self.fin_bandas = np.searchsorted(freqs, [hi for lo, hi in bandas.values()])
+        self.bins_bandas = np.maximum(self.fin_bandas - self.inicio_bandas, 1)
+
+        self.energias = np.zeros(len(bandas))
+        self.historial_flujo = np.zeros(HISTORIAL_ONSET)
+        self.idx_historial = 0
+        self.n_bloques = 0
+
+    def procesa_bloque(self, bloque, umbral_onset=1.5):
+        """
+        Añade un bloque de muestras y actualiza energías por banda y detección de golpes.
+        """
+        n = len(bloque)
+        if n >= self.fft_size:
+            self.muestras[:] = bloque[-self.fft_size:]
+        else:
+            self.muestras[:-n] = self.muestras[n:]
+            self.muestras[-n:] = bloque
+
+        np.multiply(self.muestras, self.ventana, out=self.enventanado)
+        np.abs(np.fft.rfft(self.enventanado), out=self.magnitudes)
+
+        # Energía media por banda a partir de la suma acumulada de la potencia
+        np.square(self.magnitudes, out=self.potencia)
+        np.cumsum(self.potencia, out=self.acumulada[1:])
+        np.subtract(self.acumulada[self.fin_bandas], self.acumulada[self.inicio_bandas], out=self.energias)
+        self.energias /= self.bins_bandas
+
+        # Flujo espectral: suma de los incrementos positivos de magnitud
+        np.subtract(self.magnitudes, self.magnitudes_previas, out=self.diferencia)
+        np.maximum(self.diferencia, 0.0, out=self.diferencia)
+        flujo = self.diferencia.sum()
+        self.magnitudes_previas[:] = self.magnitudes
+
+        # Golpe: flujo por encima del umbral adaptativo (mediana del historial) y de un mínimo
+        # relativo a la energía del bloque y absoluto, para que un tono estable o el silencio
+        # no generen golpes. No se detectan hasta tener el historial completo.
+        minimo = max(FLUJO_MINIMO_RELATIVO * self.magnitudes.sum(), FLUJO_MINIMO_ABSOLUTO)
+        onset = self.n_bloques >= HISTORIAL_ONSET and flujo > max(umbral_onset * np.median(self.historial_flujo), minimo)
+        self.historial_flujo[self.idx_historial] = flujo
+        self.idx_historial = (self.idx_historial + 1) % HISTORIAL_ONSET
+        self.n_bloques += 1
+
+        return self.energias, onset
+
+
+class ModulacionAudio:
+    """
+    Modulación del motor a partir de una entrada de audio: mapea la energía de cada banda
+    a escala, rotación, distorsión y FPS, y los golpes a cambios de animación.
+    """
+
+    def __init__(self, engine, parametros=None):
+        self.engine = engine
+        # Diccionario compartido: el motor puede ajustar sensibilidad y suavizado en marcha
+        self.parametros = parametros if parametros is not None else {}
+        for key, value in DEFAULT_PARAMETROS_MODULACION.items():
+            self.parametros.setdefault(key, dict(value) if isinstance(value, dict) else value)
+
+        self.freq_sample = engine.midi_parameters["FREQ_SAMPLE"]
+        self.analizador = AnalizadorEspectral(self.freq_sample, self.parametros["fft_size"])
+        self.niveles = np.zeros(len(BANDAS))  # Niveles suavizados (0-1) de cada banda
+        self.picos = np.full(len(BANDAS), 1e-9)  # Máximo reciente de cada banda
+        self.tiempo = 0.0  # Segundos de audio procesados
+        self.ultimo_cambio = -np.inf
+
+        self.bloques = queue.Queue(maxsize=64)
+        self.stream = None
+        self.thread = None
+        self.exit_flag = False
+
+    def input_callback(self, indata, frames, time_info, status):
+        """
+        Callback del stream de entrada: solo copia el bloque para no competir con la salida.
+        """
+        try:
+            self.bloques.put_nowait(indata[:, 0].copy())
+        except queue.Full:
+            pass  # Mejor perder un bloque de análisis que bloquear el audio
+
+    def procesa_bloque(self, bloque):
+        """
+        Analiza un bloque de audio y aplica la modulación al motor.
+        """
+        energias, onset = self.analizador.procesa_bloque(bloque, self.parametros["umbral_onset"])
+        self.tiempo += len(bloque) / self.freq_sample
+
+        # Normalización adaptativa respecto al máximo reciente de cada banda
+        np.maximum(self.picos * DECAIMIENTO_PICOS, energias, out=self.picos)
+        objetivo = np.clip(energias / self.picos * self.parametros["sensibilidad"], 0.0, 1.0)
+
+        suavizado = self.parametros["suavizado"]
+        self.niveles = suavizado * self.niveles + (1.0 - suavizado) * objetivo
+
+        self.aplica(onset)
+
+    def aplica(self, onset):
+        """
+        Traslada los niveles de las bandas a los parámetros del motor.
+        """
+        engine = self.engine
+        niveles = dict(zip(self.analizador.nombres_bandas, self.niveles))
+
+        for parametro, banda in self.parametros["mapeo"].items():
+            if banda is None:
+                continue
+            minimo, maximo = RANGOS[parametro]
+            valor = minimo + (maximo - minimo) * niveles[banda]
+            if parametro == "fps":
+                engine.video_parameters["fps"] = int(valor)
+            else:
+                setattr(engine, parametro, valor)
+
+        # Cambio de animación en los golpes, respetando un intervalo mínimo
+        if onset and self.parametros["cambio_animacion"] and self.tiempo - self.ultimo_cambio >= self.parametros["intervalo_cambio"]:
+            n_animaciones = len(engine.files_npz)
+            engine.video_parameters["selected_animation"] = (engine.video_parameters["selected_animation"] + 1) % n_animaciones
+            self.ultimo_cambio = self.tiempo
+
+    def start(self):
+        """
+        Abre el stream de entrada y arranca el hilo de análisis.
+        """
+        self.exit_flag = False
+        self.stream = self.engine.backend.input_stream(
+            channels=1,
+            callback=self.input_callback,
+            samplerate=self.freq_sample,
+            blocksize=self.parametros["blocksize"],
+            device=self.parametros["device"]
+        )
+        self.stream.start()
+        self.thread = threading.Thread(target=self.analysis_thread, daemon=True)
+        self.thread.start()
+        print("[INFO] Modulación por audio activada.")
+
+    def stop(self):
+        """
+        Cierra el stream de entrada y detiene el hilo de análisis.
+        """
+        self.exit_flag = True
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        print("[INFO] Modulación por audio desactivada.")
+
+    def analysis_thread(self):
+        """
+        Hilo que analiza los bloques capturados fuera del callback de audio.
+        """
+        while not self.exit_flag:
+            try:
+                bloque = self.bloques.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.procesa_bloque(bloque)
+
+    def procesa_wav(self, ruta):
+        """
+        Procesa un archivo WAV como si fuera la entrada en directo y devuelve, por bloque,
+        el tiempo, los niveles de las bandas, si hubo golpe y los parámetros resultantes.
+        """
+        muestras, freq_sample = lee_wav(ruta)
+
+        # Analizar con la frecuencia de muestreo del WAV (bandas y tiempos correctos)
+        # y restaurar después la del stream de entrada
+        freq_entrada, analizador_entrada = self.freq_sample, self.analizador
+        if freq_sample != freq_entrada:
+            print(f"[INFO] El WAV está a {freq_sample} Hz; se analiza a su propia frecuencia de muestreo.")
+            self.freq_sample = freq_sample
+            self.analizador = AnalizadorEspectral(freq_sample, self.parametros["fft_size"])
+
+        blocksize = self.parametros["blocksize"]
+        registro = []
+        start_time = time.perf_counter()
+        try:
+            for inicio in range(0, len(muestras) - blocksize + 1, blocksize):
+                self.procesa_bloque(muestras[inicio:inicio + blocksize])
+                registro.append({
+                    "tiempo": self.tiempo,
+                    "niveles": self.niveles.copy(),
+                    "scale": self.engine.scale,
+                    "rotation": self.engine.rotation,
+                    "distortion": self.engine.distortion,
+                    "fps": self.engine.video_parameters["fps"],
+                    "selected_animation": self.engine.video_parameters["selected_animation"]
+                })
+        finally:
+            self.freq_sample, self.analizador = freq_entrada, analizador_entrada
+
+        elapsed_time = time.perf_counter() - start_time
+        print(f"[INFO] '{ruta}' analizado: {len(registro)} bloques en {elapsed_time * 1000:.1f} ms.")
+        return registro
+
+
+def lee_wav(ruta):
+    """
+    Lee un archivo WAV PCM y devuelve (muestras mono en float64 en [-1, 1], frecuencia de muestreo).
+    """
+    with wave.open(ruta, "rb") as f:
+        n_canales = f.getnchannels()
+        ancho = f.getsampwidth()
+        freq_sample = f.getframerate()
+        datos = f.readframes(f.getnframes())
+
+    if ancho == 1:
+        muestras = (np.frombuffer(datos, dtype=np.uint8).astype(np.float64) - 128.0) / 128.0
+    elif ancho == 2:
+        muestras = np.frombuffer(datos, dtype="<i2").astype(np.float64) / 32768.0
+    elif ancho == 4:
+        muestras = np.frombuffer(datos, dtype="<i4").astype(np.float64) / 2147483648.0
+    else:
+        raise ValueError(f"Formato WAV no soportado ({8 * ancho} bits).")
+
+    # Mezclar a mono
+    return muestras.reshape(-1, n_canales).mean(axis=1), freq_sample
@@ -1,12 +1,111 @@
-import numpy as np
-import xml.etree.ElementTree as ET
+import argparse
+import json
 import os
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+try:
+    import resource  # No disponible en Windows
+except ImportError:
+    resource = None
 
 # Ruta de los archivos SVG subidos
 svg_files = [
     "cube.svg"
 ]
 
+FPS_SVG = 25  # Frames por segundo de las animaciones SVG originales
+
+
+class Perfil:
+    """
+    Instrumentación del preprocesado: tiempo por etapa, por frame y por archivo,
+    y puntos de entrada frente a puntos de salida.
+    """
+
+    def __init__(self):
+        self.archivos = []
+        self.actual = None
+
+    def inicia_archivo(self, archivo):
+        self.actual = {
+            "archivo": archivo,
+            "bytes_svg": os.path.getsize(archivo),
+            "etapas": {},
+            "frames": {},
+            "puntos_entrada": 0,
+            "puntos_salida": 0,
+            "inicio": time.perf_counter()
+        }
+        self.archivos.append(self.actual)
+
+    def termina_archivo(self):
+        self.actual["tiempo"] = time.perf_counter() - self.actual.pop("inicio")
+
+    def _frame(self, frame):
+        return self.actual["frames"].setdefault(frame, {"etapas": {}, "puntos_entrada": 0, "puntos_salida": 0})
+
+    @contextmanager
+    def etapa(self, nombre, frame=None):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            etapas = self.actual["etapas"]
+            etapas[nombre] = etapas.get(nombre, 0.0) + duracion
+            if frame is not None:
+                etapas = self._frame(frame)["etapas"]
+                etapas[nombre] = etapas.get(nombre, 0.0) + duracion
+
+    def cuenta_puntos(self, frame, entrada, salida):
+        datos = self._frame(frame)
+        datos["puntos_entrada"] += entrada
+        datos["puntos_salida"] += salida
+        self.actual["puntos_entrada"] += entrada
+        self.actual["puntos_salida"] += salida
+
+    def tiempo_frame(self, frame):
+        return sum(self._frame(frame)["etapas"].values())
+
+    def resumen(self, memoria_pico=None):
+        """
+        Resumen serializable a JSON con frames/s, MB/s de SVG procesado y memoria pico.
+        """
+        archivos = []
+        for datos in self.archivos:
+            tiempo = datos.get("tiempo", 0.0)
+            archivos.append({
+                "archivo": datos["archivo"],
+                "frames": len(datos["frames"]),
+                "tiempo_s": tiempo,
+                "frames_por_segundo": len(datos["frames"]) / tiempo if tiempo > 0 else None,
+                "mb_por_segundo": datos["bytes_svg"] / 1e6 / tiempo if tiempo > 0 else None,
+                "puntos_entrada": datos["puntos_entrada"],
+                "puntos_salida": datos["puntos_salida"],
+                "etapas_s": datos["etapas"],
+                "detalle_frames": [dict(frame=idx + 1, **f) for idx, f in sorted(datos["frames"].items())]
+            })
+
+        tiempo_total = sum(a["tiempo_s"] for a in archivos)
+        frames_total = sum(a["frames"] for a in archivos)
+        bytes_total = sum(d["bytes_svg"] for d in self.archivos)
+        return {
+            "archivos": archivos,
+            "frames": frames_total,
+            "tiempo_s": tiempo_total,
+            "frames_por_segundo": frames_total / tiempo_total if tiempo_total > 0 else None,
+            "mb_por_segundo": bytes_total / 1e6 / tiempo_total if tiempo_total > 0 else None,
+            "memoria_pico_mb": memoria_pico
+        }
+
+
+# Devuelve el contexto que mide una etapa, o uno vacío si no hay instrumentación
+def etapa(perfil, nombre, frame=None):
+    return perfil.etapa(nombre, frame) if perfil is not None else nullcontext()
+
 # Convierte una cadena de coordenadas en una lista de coordenadas numéricas
 def string_a_lista(coordenadas_str):
     coordenadas_lista = coordenadas_str.split()
@@ -17,26 +116,30 @@ def string_a_lista(coordenadas_str):
         coordenadas.append([coordenada_x, coordenada_y])
     return np.array(coordenadas, dtype=np.float32)
 
-# Obtiene los frames de un archivo SVG
-def obtener_frames(nombre):
+# Obtiene los frames de un archivo SVG, quedándose con uno de cada paso_frames
+def obtener_frames(nombre, paso_frames=1, perfil=None):
     lista_total = []
-    tree = ET.parse(nombre)
-    root = tree.getroot()
     namespaces = {
         'svg': 'http://www.w3.org/2000/svg',
         'inkscape': 'http://www.inkscape.org/namespaces/inkscape'
     }
 
     # Encuentra los frames que contienen grupos de paths
-    frames = root.findall(".//svg:g[@inkscape:groupmode='frame']", namespaces)
-    for f in frames:
+    with etapa(perfil, "xml"):
+        tree = ET.parse(nombre)
+        root = tree.getroot()
+        frames = root.findall(".//svg:g[@inkscape:groupmode='frame']", namespaces)
+
+    for frame_idx, f in enumerate(frames[::paso_frames]):
         lista_de_paths = []
-        paths = f.findall(".//svg:path", namespaces)
-        for p in paths:
-            path = p.get('d')
-            path_sinM = path[3:]
-            lista_de_coordenadas = string_a_lista(path_sinM)
-            lista_de_paths.append(lista_de_coordenadas)
+        with etapa(perfil, "xml", frame_idx):
+            paths = f.findall(".//svg:path", namespaces)
+        with etapa(perfil, "string_a_lista", frame_idx):
+            for p in paths:
+                path = p.get('d')
+                path_sinM = path[3:]
+                lista_de_coordenadas = string_a_lista(path_sinM)
+                lista_de_paths.append(lista_de_coordenadas)
         lista_total.append(lista_de_paths)
 
     return lista_total
@@ -93,39 +196,48 @@ def redimensiona(vector, nueva_longitud, distancias):
     return redimensionado
 
 # Redimensiona y concatena paths de un frame
-def redimensiona_y_concatena(path_list, nueva_longitud):
-    distancias_list = calcular_distancias(path_list)
-    distancia_total = sum(np.sum(dist) for dist in distancias_list)
+def redimensiona_y_concatena(path_list, nueva_longitud, perfil=None, frame_idx=None):
+    with etapa(perfil, "calcular_distancias", frame_idx):
+        distancias_list = calcular_distancias(path_list)
+        distancia_total = sum(np.sum(dist) for dist in distancias_list)
 
-    total_points = 0
-    all_points = []
-    for path, distancias in zip(path_list, distancias_list):
-        path = np.array(path)
-        n = int(round(nueva_longitud * np.sum(distancias) / distancia_total))
-        concatenado_x = redimensiona(path[:, 0], n, distancias)
-        concatenado_y = redimensiona(path[:, 1], n, distancias)
-        narr = np.column_stack((concatenado_x, concatenado_y))
-        all_points.append(narr)
-        total_points += len(narr)
-
-    if total_points > nueva_longitud:
-        redimensionado = np.vstack(all_points)[:nueva_longitud]
-    else:
-        redimensionado = np.vstack(all_points)
-        indices_originales = np.linspace(0, len(redimensionado) - 1, len(redimensionado))
-        indices_nuevos = np.linspace(0, len(redimensionado) - 1, nueva_longitud)
-        redimensionado_x = np.interp(indices_nuevos, indices_originales, redimensionado[:, 0])
-        redimensionado_y = np.interp(indices_nuevos, indices_originales, redimensionado[:, 1])
-        redimensionado = np.column_stack((redimensionado_x, redimensionado_y))
+    with etapa(perfil, "redimensiona", frame_idx):
+        total_points = 0
+        all_points = []
+        for path, distancias in zip(path_list, distancias_list):
+            path = np.array(path)
+            n = int(round(nueva_longitud * np.sum(distancias) / distancia_total))
+            concatenado_x = redimensiona(path[:, 0], n, distancias)
+            concatenado_y = redimensiona(path[:, 1], n, distancias)
+            narr = np.column_stack((concatenado_x, concatenado_y))
+            all_points.append(narr)
+            total_points += len(narr)
+
+        if total_points > nueva_longitud:
+            redimensionado = np.vstack(all_points)[:nueva_longitud]
+        else:
+            redimensionado = np.vstack(all_points)
+            indices_originales = np.linspace(0, len(redimensionado) - 1, len(redimensionado))
+            indices_nuevos = np.linspace(0, len(redimensionado) - 1, nueva_longitud)
+            redimensionado_x = np.interp(indices_nuevos, indices_originales, redimensionado[:, 0])
+            redimensionado_y = np.interp(indices_nuevos, indices_originales, redimensionado[:, 1])
+            redimensionado = np.column_stack((redimensionado_x, redimensionado_y))
 
     return redimensionado
 
-# Procesa y guarda las animaciones redimensionadas
-def procesa_multiples_animaciones(archivos_svg, nueva_longitud, verbose=False):
+# Procesa y guarda las animaciones redimensionadas.
+# Con paso_frames > 1 se guarda solo uno de cada paso_frames frames; el morphing del
+# reproductor interpola entre ellos para recuperar un movimiento suave. Los frames por
+# segundo resultantes (fps_svg / paso_frames) se guardan en la clave "fps" del .npz para
+# que el reproductor mantenga la velocidad original.
+# Si se pasa un Perfil, se mide cada etapa por frame y por archivo.
+def procesa_multiples_animaciones(archivos_svg, nueva_longitud, verbose=False, paso_frames=1, perfil=None, fps_svg=FPS_SVG):
     for archivo in archivos_svg:
         if verbose:
             print(f"Procesando archivo: {archivo}")
-        frame_list = obtener_frames(archivo)
+        if perfil is not None:
+            perfil.inicia_archivo(archivo)
+        frame_list = obtener_frames(archivo, paso_frames, perfil)
 
         frames_dict = {}
         for frame_idx, path_list in enumerate(frame_list):
@@ -134,20 +246,84 @@ def procesa_multiples_animaciones(archivos_svg, nueva_longitud, verbose=False):
                     print(f"Frame {frame_idx + 1} está vacío. Se rellenará con ceros.")
                 redimensionado = np.zeros((nueva_longitud, 2), dtype=np.float32)
             else:
-                redimensionado = redimensiona_y_concatena(path_list, nueva_longitud)
+                redimensionado = redimensiona_y_concatena(path_list, nueva_longitud, perfil, frame_idx).astype(np.float32)
 
             frames_dict[f"frame_{frame_idx + 1}"] = redimensionado
 
+            if perfil is not None:
+                perfil.cuenta_puntos(frame_idx, sum(len(path) for path in path_list), len(redimensionado))
+
             if verbose:
-                print(f"Frame {frame_idx + 1} redimensionado con {len(redimensionado)} puntos.")
+                if perfil is not None:
+                    print(f"Frame {frame_idx + 1} redimensionado con {len(redimensionado)} puntos "
+                          f"en {perfil.tiempo_frame(frame_idx) * 1000:.1f} ms.")
+                else:
+                    print(f"Frame {frame_idx + 1} redimensionado con {len(redimensionado)} puntos.")
 
         nombre_archivo = f"{os.path.splitext(archivo)[0]}_redimensionado.npz"
-        np.savez_compressed(nombre_archivo, **frames_dict)
+        with etapa(perfil, "savez_compressed"):
+            np.savez_compressed(nombre_archivo, fps=np.float32(fps_svg / paso_frames), **frames_dict)
+
+        if perfil is not None:
+            perfil.termina_archivo()
 
         if verbose:
             print(f"Archivo guardado: {nombre_archivo}")
 
 
+# Memoria pico del proceso en MB (tracemalloc si está activo, si no el máximo RSS)
+def memoria_pico_mb():
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3  # KB en Linux
+    return None
+
+
 # Ejecutar el preprocesado para todos los archivos SVG
 NUEVA_LONGITUD = 4096
-procesa_multiples_animaciones(svg_files, NUEVA_LONGITUD, verbose = True)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Preprocesa animaciones SVG para el osciloscopio.")
+    parser.add_argument("archivos", nargs="*", default=svg_files, help="Archivos SVG a procesar")
+    parser.add_argument("--longitud", type=int, default=NUEVA_LONGITUD, help="Puntos por frame")
+    parser.add_argument("--paso-frames", type=int, default=1, help="Guardar uno de cada N frames")
+    parser.add_argument("--fps-svg", type=float, default=FPS_SVG, help="Frames por segundo de los SVG originales")
+    parser.add_argument("--silencioso", action="store_true", help="No mostrar el progreso por frame")
+    parser.add_argument("--perfil", action="store_true", help="Medir el tiempo de cada etapa")
+    parser.add_argument("--resumen", help="Guardar el resumen del perfil en JSON (implica --perfil)")
+    parser.add_argument("--cprofile", help="Guardar las estadísticas de cProfile en este archivo")
+    parser.add_argument("--tracemalloc", action="store_true", help="Medir la memoria pico con tracemalloc")
+    args = parser.parse_args()
+
+    perfil = Perfil() if args.perfil or args.resumen else None
+
+    if args.tracemalloc:
+        import tracemalloc
+        tracemalloc.start()
+
+    if args.cprofile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    procesa_multiples_animaciones(args.archivos, args.longitud, verbose=not args.silencioso,
+                                  paso_frames=args.paso_frames, perfil=perfil, fps_svg=args.fps_svg)
+
+    if args.cprofile:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+        print(f"Estadísticas de cProfile guardadas en: {args.cprofile}")
+
+    if perfil is not None:
+        resumen = perfil.resumen(memoria_pico_mb())
+        if args.resumen:
+            with open(args.resumen, "w") as f:
+                json.dump(resumen, f, indent=2)
+            print(f"Resumen guardado en: {args.resumen}")
+        for datos in resumen["archivos"]:
+            etapas = ", ".join(f"{nombre} {tiempo:.3f} s" for nombre, tiempo in datos["etapas_s"].items())
+            print(f"{datos['archivo']}: {datos['frames']} frames, {datos['frames_por_segundo']:.1f} frames/s, "
+                  f"{datos['mb_por_segundo']:.2f} MB/s, puntos {datos['puntos_entrada']} -> {datos['puntos_salida']} ({etapas})")
+        if resumen["memoria_pico_mb"] is not None:
+            print(f"Memoria pico: {resumen['memoria_pico_mb']:.1f} MB")
@@ -0,0 +1,196 @@
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+
+from Osci_main import OsciEngine, DummyBackend, load_animation, load_frame_rate, REFERENCE_FPS
+
+# Rango de la señal XY que entrega el motor: normalize() deja la salida en [-3, 1]
+LIMITES_SALIDA = (-3.0, 1.0)
+
+RESOLUCION = 512        # Píxeles por lado de la pantalla simulada
+PERSISTENCIA = 0.04     # Constante de tiempo del fósforo, en segundos
+GANANCIA = 8.0          # Ganancia del mapeo de intensidad a brillo
+
+
+class SimuladorFosforo:
+    """
+    Pantalla de osciloscopio simulada: acumula el recorrido del haz en un buffer de
+    intensidad 2D y aplica un decaimiento exponencial del fósforo en cada frame de vídeo.
+    """
+
+    def __init__(self, resolucion=RESOLUCION, persistencia=PERSISTENCIA, fps=25, limites=LIMITES_SALIDA):
+        self.buffer = np.zeros((resolucion, resolucion), dtype=np.float32)
+        self.limites = limites
+        self.decaimiento = np.float32(np.exp(-1.0 / (fps * persistencia)))
+
+    def acumula(self, xy):
+        """
+        Dibuja la secuencia de muestras XY como segmentos consecutivos.
+        """
+        rasteriza_segmentos(self.buffer, xy, self.limites)
+
+    def avanza_frame(self):
+        """
+        Aplica el decaimiento del fósforo correspondiente a un frame de vídeo.
+        """
+        self.buffer *= self.decaimiento
+
+    def imagen(self, ganancia=GANANCIA):
+        """
+        Devuelve la pantalla como imagen de 8 bits (saturación suave del brillo).
+        """
+        return (255.0 * (1.0 - np.exp(-ganancia * self.buffer))).astype(np.uint8)
+
+
+# Rasteriza los segmentos entre muestras consecutivas y los acumula en el buffer.
+# Cada segmento corresponde a una muestra de tiempo del haz, así que su energía se reparte
+# entre sus píxeles: los trazos rápidos quedan más tenues que los lentos, como en el osciloscopio.
+def rasteriza_segmentos(buffer, xy, limites=LIMITES_SALIDA):
+    alto, ancho = buffer.shape
+    if len(xy) < 2:
+        return buffer
+
+    minimo, maximo = limites
+    px = (xy[:, 0] - minimo) / (maximo - minimo) * (ancho - 1)
+    py = (maximo - xy[:, 1]) / (maximo - minimo) * (alto - 1)  # El eje Y de la imagen crece hacia abajo
+
+    dx = np.diff(px)
+    dy = np.diff(py)
+
+    # Número de puntos por segmento según su longitud en píxeles (limitado para saltos del haz)
+    pasos = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+    pasos = np.minimum(pasos, 2 * max(alto, ancho))
+
+    segmento = np.repeat(np.arange(len(pasos)), pasos)
+    inicio = np.repeat(np.cumsum(pasos) - pasos, pasos)
+    t = (np.arange(len(segmento)) - inicio) / pasos[segmento]
+
+    x = np.rint(px[segmento] + dx[segmento] * t).astype(np.int64)
+    y = np.rint(py[segmento] + dy[segmento] * t).astype(np.int64)
+    pesos = 1.0 / pasos[segmento]
+
+    dentro = (x >= 0) & (x < ancho) & (y >= 0) & (y < alto)
+    indices = y[dentro] * ancho + x[dentro]
+    buffer += np.bincount(indices, weights=pesos[dentro], minlength=alto * ancho).reshape(alto, ancho).astype(buffer.dtype)
+    return buffer
+
+
+# Guarda una imagen en escala de grises de 8 bits como PNG (sin dependencias externas)
+def guarda_png(ruta, imagen):
+    alto, ancho = imagen.shape
+    filas = np.hstack((np.zeros((alto, 1), dtype=np.uint8), imagen.astype(np.uint8)))  # Filtro 0 por fila
+
+    def bloque(tipo, datos):
+        return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos))
+
+    with open(ruta, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(bloque(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 0, 0, 0, 0)))
+        f.write(bloque(b"IDAT", zlib.compress(filas.tobytes(), 6)))
+        f.write(bloque(b"IEND", b""))
+
+
+# Compara una imagen con su referencia .npy y devuelve (coincide, diferencia máxima).
+# Una referencia que falta o no se puede leer cuenta como diferencia (diferencia None).
+def compara_con_referencia(imagen, ruta_referencia, tolerancia=2):
+    try:
+        referencia = np.load(ruta_referencia)
+    except (OSError, ValueError):
+        return False, None
+    if referencia.shape != imagen.shape:
+        return False, 255
+    diferencia = int(np.max(np.abs(imagen.astype(np.int16) - referencia.astype(np.int16))))
+    return diferencia <= tolerancia, diferencia
+
+
+# Genera la previsualización de una animación .npz pasando por el motor de audio completo
+# (efectos, morphing y tabla de ondas) y devuelve la lista de imágenes de cada frame de vídeo
+def previsualiza_animacion(archivo_npz, frecuencia=50.0, fps=25, resolucion=RESOLUCION,
+                           persistencia=PERSISTENCIA, engine=None, verbose=False):
+    backend = DummyBackend()
+    if engine is None:
+        engine = OsciEngine(backend=backend, audio_mode="ORDENADOR",
+                            midi_parameters={"frequency": frecuencia}, video_parameters={"fps": fps})
+    else:
+        engine.backend = backend
+
+    stream = backend.output_stream(
+        channels=engine.midi_parameters["NUM_CHANNELS"],
+        callback=engine.callback,
+        blocksize=engine.midi_parameters["audio_buffer_len"],
+        dtype=engine.dtype.name
+    )
+    simulador = SimuladorFosforo(resolucion, persistencia, fps)
+    frames = load_animation(archivo_npz, engine.dtype)
+    frame_rate = load_frame_rate(archivo_npz)
+    muestras_por_frame = engine.midi_parameters["FREQ_SAMPLE"] / fps
+
+    # Frames de vídeo necesarios para recorrer la animación una vez (a fps / REFERENCE_FPS
+    # veces su velocidad guardada, como en el reproductor)
+    n_frames_video = len(frames) if frame_rate is None else int(np.ceil(len(frames) * REFERENCE_FPS / frame_rate))
+
+    start_time = time.perf_counter()
+    imagenes = []
+    ultima = None  # Última muestra del bloque anterior, para no cortar el trazo
+    for frame_idx in range(n_frames_video):
+        engine.advance_frame(frames, frame_rate)
+
+        # Generar las muestras de audio que corresponden a este frame de vídeo
+        while engine.sample_counter < (frame_idx + 1) * muestras_por_frame:
+            xy = stream.pull()[:, 0:2]
+            simulador.acumula(xy if ultima is None else np.vstack((ultima, xy)))
+            ultima = xy[-1:]
+
+        imagenes.append(simulador.imagen())
+        simulador.avanza_frame()
+
+    if verbose:
+        elapsed_time = time.perf_counter() - start_time
+        duracion = n_frames_video / fps
+        print(f"Previsualización de {archivo_npz}: {n_frames_video} frames en {elapsed_time:.2f} s "
+              f"({duracion / elapsed_time:.1f}x tiempo real)")
+
+    return imagenes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Previsualiza una animación .npz simulando el fósforo del osciloscopio.")
+    parser.add_argument("archivo", help="Animación preprocesada (.npz)")
+    parser.add_argument("--salida", default="previsualizacion", help="Directorio de salida")
+    parser.add_argument("--formato", choices=("png", "npy"), default="png")
+    parser.add_argument("--frecuencia", type=float, default=50.0, help="Frecuencia de reproducción en Hz")
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--resolucion", type=int, default=RESOLUCION)
+    parser.add_argument("--persistencia", type=float, default=PERSISTENCIA, help="Constante de tiempo del fósforo en segundos")
+    parser.add_argument("--referencia", help="Directorio con imágenes .npy de referencia para comparar")
+    args = parser.parse_args()
+
+    imagenes = previsualiza_animacion(args.archivo, args.frecuencia, args.fps, args.resolucion,
+                                      args.persistencia, verbose=True)
+
+    os.makedirs(args.salida, exist_ok=True)
+    fallos = 0
+    for idx, imagen in enumerate(imagenes):
+        nombre = os.path.join(args.salida, f"frame_{idx + 1}")
+        if args.formato == "png":
+            guarda_png(nombre + ".png", imagen)
+        else:
+            np.save(nombre + ".npy", imagen)
+
+        if args.referencia:
+            coincide, diferencia = compara_con_referencia(imagen, os.path.join(args.referencia, f"frame_{idx + 1}.npy"))
+            if not coincide:
+                fallos += 1
+                if diferencia is None:
+                    print(f"Frame {idx + 1}: no se encontró la referencia o no se pudo leer.")
+                else:
+                    print(f"Frame {idx + 1} difiere de la referencia (diferencia máxima {diferencia}).")
+
+    if args.referencia:
+        print(f"Comparación con la referencia: {len(imagenes) - fallos}/{len(imagenes)} frames coinciden.")
+        if fallos > 0:
+            sys.exit(1)
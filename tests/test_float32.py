@@ -0,0 +1,61 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Osci_main import OsciEngine, DummyBackend, load_animation  # noqa: E402
+
+N_BLOQUES = 64
+BLOQUES_POR_FRAME = 4
+
+
+@pytest.fixture
+def animacion(tmp_path):
+    # Animación sintética: una elipse que gira y cambia de tamaño en cada frame
+    t = np.linspace(0.0, 2.0 * np.pi, 4096, endpoint=False)
+    frames = {}
+    for i in range(8):
+        fase = i * np.pi / 8
+        radio = 0.5 + 0.05 * i
+        frames[f"frame_{i + 1}"] = np.column_stack((radio * np.cos(t + fase), 0.7 * radio * np.sin(t))).astype(np.float32)
+    ruta = tmp_path / "elipse_redimensionado.npz"
+    np.savez_compressed(ruta, **frames)
+    return str(ruta)
+
+
+def renderiza(archivo_npz, dtype):
+    backend = DummyBackend()
+    engine = OsciEngine(backend=backend, audio_mode="ORDENADOR", midi_parameters={"frequency": 110.0},
+                        dtype=dtype)
+    engine.rotation = 30.0
+    engine.distortion = 0.2
+    stream = backend.output_stream(
+        channels=engine.midi_parameters["NUM_CHANNELS"],
+        callback=engine.callback,
+        blocksize=engine.midi_parameters["audio_buffer_len"],
+        dtype=engine.dtype.name
+    )
+    frames = load_animation(archivo_npz, engine.dtype)
+
+    bloques = []
+    for i in range(N_BLOQUES):
+        if i % BLOQUES_POR_FRAME == 0:
+            engine.advance_frame(frames)
+        bloques.append(stream.pull())
+    return np.concatenate(bloques)
+
+
+def test_salida_float32(animacion):
+    salida = renderiza(animacion, np.float32)
+    assert salida.dtype == np.float32
+
+
+def test_float32_coincide_con_float64(animacion):
+    salida32 = renderiza(animacion, np.float32)
+    salida64 = renderiza(animacion, np.float64)
+
+    assert np.all(np.isfinite(salida32))
+    np.testing.assert_allclose(salida32, salida64, rtol=0, atol=5e-6)